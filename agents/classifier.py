@@ -0,0 +1,287 @@
+import ast
+import asyncio
+import re
+import threading
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+from config.settings import (
+    CLASSIFIER_EMBEDDING_TIER,
+    CLASSIFIER_EMBEDDING_THRESHOLD,
+)
+
+TASKS = ('generate', 'explain', 'unclear')
+TIERS = ('rules', 'embedding', 'llm')
+
+# Same keyword heuristic explain_code uses to decide whether there is any code at all
+CODE_KEYWORDS = ['def ', 'class ', 'import ', 'for ', 'if ', 'while ', '=', 'print', 'return']
+
+# A request verb only counts when the same sentence names something to code (or a
+# signature like "has_close_elements(xs)"): "make me laugh" is left to the next tier
+GENERATE_PATTERN = re.compile(
+    r"^\s*(?:please\s+|can you\s+|could you\s+)?(?:code up\b|"
+    r"(?:write|generate|create|implement|build|make|give me|produce)\b[^\n.!?]*?"
+    r"(?:\b(?:functions?|methods?|class(?:es)?|scripts?|programs?|code|snippets?|python|"
+    r"algorithms?|decorators?|modules?|tests?|regex)\b|\w\())"
+    r"|\b(?:function|method|class|script|program|snippet)\s+(?:that|which|to|for)\b",
+    re.IGNORECASE
+)
+EXPLAIN_PATTERN = re.compile(
+    r"\b(?:explain|describe|walk me through|what does|what is this|how does|why does|"
+    r"what(?:'s| is) the (?:time|space) complexity|analy[sz]e|interpret|understand)\b",
+    re.IGNORECASE
+)
+FENCE_PATTERN = re.compile(r"```(?:python|py)?\s*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+CODE_START_PATTERN = re.compile(
+    r"^\s*(?:@\w|async\s+def\s|def\s|class\s|import\s|from\s+\S+\s+import\s|for\s|while\s|if\s|return\b|print\()",
+    re.MULTILINE
+)
+# Code pasted inline after a lead-in, e.g. "explain this: def foo(x): ..."
+INLINE_CODE_PATTERN = re.compile(r"(?:^|[\s:`])((?:async\s+)?def\s+\w+\s*\(|class\s+\w+\s*[:(])")
+STATEMENT_NODES = (
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom,
+    ast.For, ast.While, ast.If, ast.With, ast.Try, ast.Assign, ast.AugAssign, ast.Return
+)
+
+
+class Classification(NamedTuple):
+    task: str
+    tier: str
+    raw: str
+    latency: float
+
+
+def looks_like_code(text: str) -> bool:
+    """Cheap substring scan for anything that resembles code"""
+    lowered = text.lower()
+    return any(k in lowered for k in CODE_KEYWORDS)
+
+
+def extract_python_code(text: str) -> Optional[str]:
+    """Return the Python code embedded in the input, if any parses"""
+    candidates = FENCE_PATTERN.findall(text)
+    start = CODE_START_PATTERN.search(text)
+    if start:
+        candidates.append(text[start.start():])
+    inline = INLINE_CODE_PATTERN.search(text)
+    if inline:
+        candidates.append(text[inline.start(1):])
+    for candidate in candidates:
+        try:
+            tree = ast.parse(candidate)
+        except (SyntaxError, ValueError):
+            continue
+        # Plain English often parses as a bare expression, so require real statements
+        if any(isinstance(node, STATEMENT_NODES) for node in ast.walk(tree)):
+            return candidate
+    return None
+
+
+def classify_by_rules(text: str) -> Optional[str]:
+    """Tier 1: decide obvious inputs from verbs and pasted code, or return None"""
+    if not looks_like_code(text) and not GENERATE_PATTERN.search(text):
+        return None
+    has_code = extract_python_code(text) is not None
+    wants_explain = bool(EXPLAIN_PATTERN.search(text))
+    wants_generate = bool(GENERATE_PATTERN.search(text))
+
+    if has_code:
+        # "write tests for this: def ..." is genuinely ambiguous, leave it to the next tier
+        if wants_generate and not wants_explain:
+            return None
+        return 'explain'
+    if wants_generate and not wants_explain:
+        return 'generate'
+    return None
+
+
+def parse_llm_label(raw: str) -> str:
+    match = re.search(r"(generate|explain|unclear)", raw)
+    return match.group(1) if match else 'unclear'
+
+
+def parse_batch_labels(raw: str, count: int):
+    """Labels from a classify_batch_prompt reply, in input order; None where a line is missing"""
+    labels = [None] * count
+    for number, label in re.findall(r"(\d+)\s*[:.)-]\s*\W*(generate|explain|unclear)", raw.lower()):
+        index = int(number) - 1
+        if 0 <= index < count and labels[index] is None:
+            labels[index] = label
+    return labels
+
+
+# Seed examples for the embedding tier; mirrors the few-shot examples in classify_prompt
+TRAINING_EXAMPLES = [
+    ("write a function to sort a list", 'generate'),
+    ("generate function that adds two numbers", 'generate'),
+    ("give me a function that reverses a string", 'generate'),
+    ("create a python class for a bank account", 'generate'),
+    ("implement binary search in python", 'generate'),
+    ("I need code that reads a csv file and sums a column", 'generate'),
+    ("python function to check if a number is prime", 'generate'),
+    ("how do I write a decorator that caches results", 'generate'),
+    ("explain this function: def foo(x): return x+1", 'explain'),
+    ("what is the time complexity of this code?", 'explain'),
+    ("what does this loop do: for i in range(10): print(i)", 'explain'),
+    ("can you walk me through this snippet x = [i*i for i in data]", 'explain'),
+    ("why does this return None: def f(): print(1)", 'explain'),
+    ("describe how this class works: class Stack: pass", 'explain'),
+    ("I love pizza!", 'unclear'),
+    ("what's the best programming language?", 'unclear'),
+    ("can you help me?", 'unclear'),
+    ("hello there", 'unclear'),
+    ("what's the weather like today", 'unclear'),
+    ("tell me a joke", 'unclear'),
+]
+
+
+class EmbeddingClassifier:
+    """Tier 2: softmax regression over the e5 embeddings from vectorstore.retriever"""
+
+    def __init__(self, examples=TRAINING_EXAMPLES, epochs=300, learning_rate=0.5):
+        self.examples = examples
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self._weights = None
+        self._bias = None
+        self._lock = threading.Lock()
+
+    def _embed(self, texts):
+        import numpy as np
+        from vectorstore.retriever import get_embedding_model
+        return np.asarray(get_embedding_model().embed_documents(texts), dtype=np.float32)
+
+    def fit(self):
+        import numpy as np
+        x = self._embed([text for text, _ in self.examples])
+        y = np.array([TASKS.index(label) for _, label in self.examples])
+        onehot = np.eye(len(TASKS), dtype=np.float32)[y]
+        weights = np.zeros((x.shape[1], len(TASKS)), dtype=np.float32)
+        bias = np.zeros(len(TASKS), dtype=np.float32)
+        for _ in range(self.epochs):
+            logits = x @ weights + bias
+            logits -= logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            grad = (probs - onehot) / len(x)
+            weights -= self.learning_rate * (x.T @ grad)
+            bias -= self.learning_rate * grad.sum(axis=0)
+        self._weights, self._bias = weights, bias
+
+    def predict(self, text: str):
+        """Return (task, probability) for the input"""
+        import numpy as np
+        with self._lock:
+            if self._weights is None:
+                self.fit()
+        logits = self._embed([text])[0] @ self._weights + self._bias
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        best = int(probs.argmax())
+        return TASKS[best], float(probs[best])
+
+
+class ClassifierStats:
+    """Thread-safe per-tier hit counters and latency totals"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = {tier: 0 for tier in TIERS}
+        self.latency = {tier: 0.0 for tier in TIERS}
+
+    def record(self, tier: str, latency: float):
+        with self._lock:
+            self.hits[tier] += 1
+            self.latency[tier] += latency
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self.hits.values())
+            return {
+                'total': total,
+                'llm_calls_saved': total - self.hits['llm'],
+                'tiers': {
+                    tier: {
+                        'hits': self.hits[tier],
+                        'hit_rate': self.hits[tier] / total if total else 0.0,
+                        'avg_latency_ms': 1000 * self.latency[tier] / self.hits[tier] if self.hits[tier] else 0.0,
+                    }
+                    for tier in TIERS
+                },
+            }
+
+
+stats = ClassifierStats()
+_embedding_classifier = None
+
+
+def get_embedding_classifier():
+    """Get a singleton embedding classifier instance"""
+    global _embedding_classifier
+    if _embedding_classifier is None:
+        _embedding_classifier = EmbeddingClassifier()
+    return _embedding_classifier
+
+
+def classify_fast(text: str):
+    """Run the cheap tiers; return (task, tier) or None when the LLM has to decide"""
+    task = classify_by_rules(text)
+    if task is not None:
+        return task, 'rules'
+
+    if CLASSIFIER_EMBEDDING_TIER:
+        try:
+            task, probability = get_embedding_classifier().predict(text)
+            if probability >= CLASSIFIER_EMBEDDING_THRESHOLD:
+                return task, 'embedding'
+        except Exception as e:
+            print(f"Embedding classifier unavailable, falling back to LLM: {e}")
+    return None
+
+
+def classify(text: str, llm_classify: Callable[[str], str]) -> Classification:
+    """Run the tiers in order and stop at the first confident answer.
+
+    ``llm_classify`` receives the raw user input and returns the model's raw reply;
+    it is only called when the cheaper tiers cannot decide.
+    """
+    start = time.perf_counter()
+    fast = classify_fast(text)
+    if fast is not None:
+        return _finish(fast[0], fast[1], fast[0], start)
+    raw = llm_classify(text).strip().lower()
+    return _finish(parse_llm_label(raw), 'llm', raw, start)
+
+
+async def aclassify(text: str, llm_classify: Callable[[str], Awaitable[str]]) -> Classification:
+    """Async counterpart of classify; ``llm_classify`` is a coroutine function"""
+    start = time.perf_counter()
+    if CLASSIFIER_EMBEDDING_TIER:
+        # The embedding tier runs the transformer, keep it off the event loop
+        fast = await asyncio.to_thread(classify_fast, text)
+    else:
+        fast = classify_fast(text)
+    if fast is not None:
+        return _finish(fast[0], fast[1], fast[0], start)
+    raw = (await llm_classify(text)).strip().lower()
+    return _finish(parse_llm_label(raw), 'llm', raw, start)
+
+
+def _finish(task, tier, raw, start):
+    latency = time.perf_counter() - start
+    stats.record(tier, latency)
+    return Classification(task=task, tier=tier, raw=raw, latency=latency)
+
+
+if __name__ == "__main__":
+    # Dry run over a file of queries (one per line) to see how many LLM calls the cheap tiers save
+    import json
+    import sys
+
+    with open(sys.argv[1]) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    for query in queries:
+        classify(query, lambda text: 'unclear')
+    print(json.dumps(stats.snapshot(), indent=2))
@@ -0,0 +1,356 @@
+"""Static analysis for the explain route.
+
+The snippet is parsed with ``ast`` and summarized (definitions, arguments, control
+flow, a complexity estimate, called names), so the LLM gets the code plus that
+summary under a much shorter prompt than the whole question. A plain "explain
+this" about a few lines is answered from templates with no LLM call at all.
+Explanations are cached under a hash of the normalized syntax tree, so the same
+code reformatted, recommented or requoted is a hit.
+"""
+import ast
+import hashlib
+import re
+import sys
+import threading
+from typing import NamedTuple, Optional
+from utils import metrics
+from agents.classifier import CODE_START_PATTERN, STATEMENT_NODES, extract_python_code
+from prompts.prompts import explain_prompt, explain_summary_prompt
+from config.settings import EXPLAIN_TEMPLATE_MAX_LINES, EXPLAIN_CACHE_SIZE
+
+# `code` quoted inline, e.g. "please explain `sorted(d.items(), key=lambda kv: kv[1])`"
+INLINE_SPAN = re.compile(r"`([^`\n]+)`")
+# A request made only of these words asks for nothing beyond a plain explanation
+GENERIC_WORDS = {
+    "please", "can", "could", "you", "me", "explain", "describe", "walk", "through", "what",
+    "does", "do", "is", "how", "work", "works", "this", "these", "the", "following", "here",
+    "it", "a", "python", "code", "function", "snippet", "line", "lines", "loop", "class", "program",
+}
+EXPRESSION_NODES = (
+    ast.Call, ast.BinOp, ast.BoolOp, ast.Compare, ast.Subscript, ast.Lambda,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.NamedExpr,
+)
+# Where code may start after a lead-in; only the first few are tried, each costs a parse
+LEAD_IN = re.compile(r"[:\n]")
+MAX_LEAD_INS = 3
+LOOP_NODES = (ast.For, ast.AsyncFor, ast.While, ast.comprehension)
+
+
+class Analysis(NamedTuple):
+    code: str
+    tree: ast.Module
+    question: str  # what the input asks beyond the code; "" for a plain "explain this"
+    key: str       # cache key: normalized AST plus question
+
+
+def _is_code(tree):
+    """Statements, or an expression English would not parse as (a call, operator, subscript...)"""
+    return any(isinstance(node, STATEMENT_NODES + EXPRESSION_NODES) for node in ast.walk(tree))
+
+
+def _tails(text):
+    """The input, then what follows each of its first few lead-ins ("explain:", a line break)"""
+    yield text
+    for match in list(LEAD_IN.finditer(text))[:MAX_LEAD_INS]:
+        yield text[match.end():].lstrip(" \t")
+
+
+def find_code(text: str):
+    """(code, tree) of the Python snippet in the input, or None if nothing parses"""
+    code = extract_python_code(text)
+    if code is not None:
+        return code.strip("\n"), ast.parse(code)
+    # Bare statements such as "explain: x = 0" or "explain:\nx = 1\nprint(x)"
+    for candidate in _tails(text):
+        try:
+            tree = ast.parse(candidate)
+        except (SyntaxError, ValueError):
+            continue
+        if _is_code(tree):
+            return candidate.strip("\n"), tree
+    # Backticks mark code explicitly, so any span that parses counts
+    for candidate in INLINE_SPAN.findall(text):
+        try:
+            return candidate, ast.parse(candidate)
+        except (SyntaxError, ValueError):
+            continue
+    return None
+
+
+def has_code(text: str) -> bool:
+    """Python that parses, or lines that start like code (other languages, broken snippets)"""
+    return find_code(text) is not None or bool(CODE_START_PATTERN.search(text)) or "```" in text
+
+
+def analyze(text: str) -> Optional[Analysis]:
+    found = find_code(text)
+    if found is None:
+        return None
+    code, tree = found
+    rest = re.sub(r"```\w*", " ", text.replace(code, " "))
+    words = re.findall(r"[a-z']+", rest.lower())
+    question = "" if set(words) <= GENERIC_WORDS else " ".join(words)
+    # ast.dump leaves out positions, comments and formatting
+    key = hashlib.sha256(f"{ast.dump(tree)}\0{question}".encode()).hexdigest()[:32]
+    return Analysis(code, tree, question, key)
+
+
+def _loop_depth(node, depth=0):
+    if isinstance(node, LOOP_NODES):
+        depth += 1
+    return max([depth] + [_loop_depth(child, depth) for child in ast.iter_child_nodes(node)])
+
+
+def _called_name(call):
+    func = call.func
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+
+def _recursive(function, method=False):
+    """Calls itself: by name, or as self.<name>/cls.<name> in a method. ``items.append(x)``
+    inside a method named append is a call on another object, not recursion."""
+    for node in ast.walk(function):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == function.name:
+            return True
+        if (method and isinstance(func, ast.Attribute) and func.attr == function.name
+                and isinstance(func.value, ast.Name) and func.value.id in ("self", "cls")):
+            return True
+    return False
+
+
+def summarize(tree: ast.Module) -> dict:
+    """Definitions, control flow, complexity estimate and called names of a module"""
+    functions, classes, imports, calls = [], [], [], set()
+    control = {"if": 0, "loop": 0, "try": 0, "with": 0, "comprehension": 0, "yield": 0, "await": 0}
+    decisions, methods = 0, set()
+    # ast.walk is breadth-first, so a class is seen before its methods
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node not in methods:
+            recursive = _recursive(node)
+            functions.append({
+                "name": node.name,
+                "args": ast.unparse(node.args),
+                "returns": ast.unparse(node.returns) if node.returns else None,
+                "async": isinstance(node, ast.AsyncFunctionDef),
+                "recursive": recursive,
+                "lines": node.end_lineno - node.lineno + 1,
+            })
+        elif isinstance(node, ast.ClassDef):
+            own = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            methods.update(own)
+            classes.append({
+                "name": node.name,
+                "bases": [ast.unparse(base) for base in node.bases],
+                "methods": [f"{n.name}({ast.unparse(n.args)})" for n in own],
+            })
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.Call) and _called_name(node):
+            calls.add(_called_name(node))
+        if isinstance(node, (ast.If, ast.IfExp)):
+            control["if"] += 1
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            control["loop"] += 1
+        elif isinstance(node, ast.Try):
+            control["try"] += 1
+        elif isinstance(node, (ast.With, ast.AsyncWith)):
+            control["with"] += 1
+        elif isinstance(node, ast.comprehension):
+            control["comprehension"] += 1
+        elif isinstance(node, (ast.Yield, ast.YieldFrom)):
+            control["yield"] += 1
+        elif isinstance(node, ast.Await):
+            control["await"] += 1
+        # McCabe: one path, plus one per branch point
+        if isinstance(node, (ast.If, ast.IfExp, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler)):
+            decisions += 1
+        elif isinstance(node, ast.BoolOp):
+            decisions += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            decisions += 1 + len(node.ifs)
+    depth = _loop_depth(tree)
+    if any(f["recursive"] for f in functions) or any(_recursive(node, method=True) for node in methods):
+        growth = "recursive: depends on the recursion depth and branching"
+    elif depth == 0:
+        growth = "O(1) apart from the functions it calls"
+    else:
+        growth = f"O(n{'' if depth == 1 else f'^{depth}'}) in the size of the iterated data"
+    return {
+        "functions": functions,
+        "classes": classes,
+        "imports": imports,
+        "calls": sorted(calls - {f["name"] for f in functions}),
+        "control_flow": {name: count for name, count in control.items() if count},
+        "loop_depth": depth,
+        "cyclomatic_complexity": 1 + decisions,
+        "estimated_time": growth,
+    }
+
+
+def format_summary(summary: dict) -> str:
+    lines = []
+    for f in summary["functions"]:
+        signature = f"{'async ' if f['async'] else ''}{f['name']}({f['args']})"
+        if f["returns"]:
+            signature += f" -> {f['returns']}"
+        notes = f"{f['lines']} line{'s' if f['lines'] > 1 else ''}" + (", recursive" if f["recursive"] else "")
+        lines.append(f"- function {signature} ({notes})")
+    for c in summary["classes"]:
+        bases = f"({', '.join(c['bases'])})" if c["bases"] else ""
+        lines.append(f"- class {c['name']}{bases}, methods: {', '.join(c['methods']) or 'none'}")
+    if summary["imports"]:
+        lines.append(f"- imports: {', '.join(summary['imports'])}")
+    if summary["control_flow"]:
+        flow = ", ".join(f"{name}: {count}" for name, count in summary["control_flow"].items())
+        if summary["loop_depth"] > 1:
+            flow += f"; loops nested {summary['loop_depth']} deep"
+        lines.append(f"- control flow: {flow}")
+    lines.append(f"- cyclomatic complexity {summary['cyclomatic_complexity']}; "
+                 f"estimated time {summary['estimated_time']}")
+    if summary["calls"]:
+        lines.append(f"- calls: {', '.join(summary['calls'])}")
+    return "\n".join(lines)
+
+
+def _names(args):
+    names = [f"`{a.arg}`" for a in args.posonlyargs + args.args + args.kwonlyargs]
+    if args.vararg:
+        names.append(f"`*{args.vararg.arg}`")
+    if args.kwarg:
+        names.append(f"`**{args.kwarg.arg}`")
+    if not names:
+        return "no arguments"
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+
+def _body(statements):
+    """The one describable statement of a block (ignoring a docstring), else None"""
+    if (statements and isinstance(statements[0], ast.Expr)
+            and isinstance(statements[0].value, ast.Constant) and isinstance(statements[0].value.value, str)):
+        statements = statements[1:]
+    return _describe(statements[0]) if len(statements) == 1 else None
+
+
+def _describe(node) -> Optional[str]:
+    """A clause describing one simple statement, or None when it needs a real explanation"""
+    u = ast.unparse
+    if isinstance(node, ast.Return):
+        return f"returns `{u(node.value)}`" if node.value else "returns None"
+    if isinstance(node, ast.Assign):
+        return f"sets `{' = '.join(u(t) for t in node.targets)}` to `{u(node.value)}`"
+    if isinstance(node, ast.AnnAssign) and node.value is not None:
+        return f"sets `{u(node.target)}` (a `{u(node.annotation)}`) to `{u(node.value)}`"
+    if isinstance(node, ast.AugAssign):
+        return f"updates `{u(node.target)}` in place (`{u(node)}`)"
+    if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+        return f"calls `{u(node.value)}`"
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return f"imports {', '.join(f'`{a.name}`' for a in node.names)}"
+    if isinstance(node, ast.Pass):
+        return "does nothing (`pass`)"
+    if isinstance(node, ast.For) and not node.orelse and (body := _body(node.body)):
+        return f"loops over `{u(node.iter)}`, taking each item as `{u(node.target)}`, and each time {body}"
+    if isinstance(node, ast.While) and not node.orelse and (body := _body(node.body)):
+        return f"repeats while `{u(node.test)}` is true, and each time {body}"
+    if isinstance(node, ast.If) and not node.orelse and (body := _body(node.body)):
+        return f"{body} when `{u(node.test)}` is true"
+    if isinstance(node, ast.FunctionDef) and not node.decorator_list and (body := _body(node.body)):
+        if _recursive(node):
+            return None
+        return f"defines a function `{node.name}` that takes {_names(node.args)} and {body}"
+    return None
+
+
+def template_explanation(analysis: Analysis) -> Optional[str]:
+    """A ready explanation of a tiny snippet, or None when it needs the LLM"""
+    lines = [line for line in analysis.code.splitlines() if line.strip() and not line.strip().startswith("#")]
+    if analysis.question or not lines or len(lines) > EXPLAIN_TEMPLATE_MAX_LINES:
+        return None
+    clauses = [_describe(node) for node in analysis.tree.body]
+    if not clauses or None in clauses:
+        return None
+    if len(clauses) == 1:
+        return f"This code {clauses[0]}."
+    steps = "\n".join(f"{i}. It {clause}." for i, clause in enumerate(clauses, 1))
+    return f"This code runs {len(clauses)} steps in order:\n{steps}"
+
+
+class ExplainStats:
+    """Thread-safe counts of how explanations were produced"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.paths = {"cache": 0, "template": 0, "summary_prompt": 0, "full_prompt": 0}
+
+    def record(self, path):
+        with self._lock:
+            self.paths[path] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self.paths.values())
+            saved = self.paths["cache"] + self.paths["template"]
+            return {**self.paths, 'llm_calls_saved': saved, 'llm_call_rate': 1 - saved / total if total else 0.0}
+
+
+stats = ExplainStats()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Get the singleton explanation cache, or None when disabled"""
+    global _cache
+    if _cache is None and EXPLAIN_CACHE_SIZE:
+        with _cache_lock:
+            if _cache is None:
+                from vectorstore.query_cache import LRUCache
+                _cache = LRUCache(EXPLAIN_CACHE_SIZE, lambda key, text: sys.getsizeof(key) + sys.getsizeof(text))
+    return _cache
+
+
+def quick_answer(analysis: Analysis) -> Optional[str]:
+    """A cached or template explanation, when one makes the LLM call unnecessary"""
+    cache = get_cache()
+    answer = cache.get(analysis.key) if cache is not None else None
+    path = "cache"
+    if answer is None:
+        answer, path = template_explanation(analysis), "template"
+    if answer is not None:
+        stats.record(path)
+        metrics.annotate(explain_path=path)
+    return answer
+
+
+def build_prompt(user_input: str, analysis: Optional[Analysis], history: str = "") -> str:
+    """The short summary prompt for code that parses, else the full explain prompt"""
+    if analysis is None:
+        stats.record("full_prompt")
+        return explain_prompt(user_input, history)
+    stats.record("summary_prompt")
+    metrics.annotate(explain_path="summary_prompt")
+    summary = format_summary(summarize(analysis.tree))
+    return explain_summary_prompt(analysis.code, summary, analysis.question, history)
+
+
+def remember(analysis: Optional[Analysis], explanation: str):
+    cache = get_cache()
+    if analysis is not None and cache is not None and explanation.strip():
+        cache.put(analysis.key, explanation)
+
+
+def cache_stats() -> dict:
+    return {**stats.snapshot(), **({f"cache_{k}": v for k, v in _cache.stats().items()} if _cache else {})}
+
+
+metrics.add_gauges("explain", cache_stats)
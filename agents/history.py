@@ -0,0 +1,110 @@
+"""Compact conversation history for multi-turn sessions.
+
+The session keeps only (question, answer) message pairs, never the expanded
+prompts. Once they exceed SESSION_HISTORY_TOKEN_BUDGET the oldest turns are
+removed from the checkpoint and folded into a running summary.
+"""
+import re
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from utils.context_packer import count_tokens
+from agents.classifier import GENERATE_PATTERN, extract_python_code
+from config.settings import (
+    SESSION_HISTORY_TOKEN_BUDGET,
+    SESSION_SUMMARIZE,
+    SESSION_SUMMARY_MAX_CHARS
+)
+
+# Questions that only make sense against the previous turn. A bare pronoun is not enough
+# ("Is it possible to sort a dict?" is a new question), nor is an opener like "ok" or
+# "now" ("Ok, write a binary search"): the pronoun has to be the object of an edit or
+# redo verb ("make it recursive", "fix it", "do the same for lists"), or the question
+# has to name the previous answer ("the above", "your code") or open with a comparison.
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(?:what about|how about|instead)\b"
+    r"|\b(?:make|change|fix|rewrite|redo|do|try|refactor|convert|modify|update|extend|simplify|"
+    r"optimi[sz]e|shorten|improve|translate|turn|explain|test)\s+(?:it|them|that|this|those)"
+    r"(?:\s+(?:one|again)|\b)(?!\s+(?:code|function|snippet)\b)"
+    r"|\bdo\s+the\s+same\b|\b(?:that one|this one|the above|the previous (?:one|code|answer|version)"
+    r"|the last one|your (?:code|answer|function|solution|version))\b",
+    re.IGNORECASE
+)
+
+ASKED_PREFIX = "Earlier the user asked: "
+
+
+def looks_like_follow_up(question: str) -> bool:
+    # A question that brings its own code, or opens as a request of its own ("write a
+    # function that returns its argument"), does not lean on the previous answer
+    if "```" in question or GENERATE_PATTERN.match(question) or extract_python_code(question) is not None:
+        return False
+    return bool(FOLLOW_UP_PATTERN.search(question))
+
+
+def is_follow_up(question: str, state) -> bool:
+    """A follow-up needs a previous answer in the session to refer to"""
+    return looks_like_follow_up(question) and any(isinstance(m, AIMessage) for m in state.get("message", []))
+
+
+def turns(messages):
+    """Group the compact history into [(question, answer)] pairs, oldest first"""
+    pairs, question = [], None
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            question = message
+        elif isinstance(message, AIMessage) and question is not None:
+            pairs.append((question, message))
+            question = None
+    return pairs
+
+
+def format_history(state, exclude_last=True) -> str:
+    """Summary plus earlier turns as prompt text; the current question is left out"""
+    messages = list(state.get("message", []))
+    if exclude_last and messages and isinstance(messages[-1], HumanMessage):
+        messages = messages[:-1]
+    lines = []
+    if state.get("summary"):
+        lines.append(f"Summary of earlier conversation: {state['summary']}")
+    for question, answer in turns(messages):
+        lines.append(f"User: {question.content}\nAssistant: {answer.content}")
+    return "\n\n".join(lines)
+
+
+def _fold_into_summary(summary, dropped, summarize=None):
+    if summarize is not None:
+        text = "\n\n".join(f"User: {q.content}\nAssistant: {a.content}" for q, a in dropped)
+        return summarize(summary, text).strip()
+    # Without an LLM, remember which questions were asked
+    asked = "; ".join(" ".join(q.content.split())[:120] for q, _ in dropped)
+    if not summary:
+        summary = ASKED_PREFIX + asked
+    elif summary.startswith(ASKED_PREFIX):
+        summary = f"{summary}; {asked}"
+    else:
+        summary = f"{summary} {ASKED_PREFIX}{asked}"
+    if len(summary) > SESSION_SUMMARY_MAX_CHARS:
+        # Keep the most recent questions
+        summary = ASKED_PREFIX + "..." + summary[-(SESSION_SUMMARY_MAX_CHARS - len(ASKED_PREFIX) - 3):]
+    return summary
+
+
+def compact(state, budget=SESSION_HISTORY_TOKEN_BUDGET, summarize=None) -> dict:
+    """State update that drops the oldest turns until the history fits ``budget`` tokens.
+
+    ``summarize(summary, dropped_text)`` is called with an LLM when SESSION_SUMMARIZE is
+    on; otherwise the dropped questions are noted in the summary as is. The latest
+    turn is always kept.
+    """
+    pairs = turns(state.get("message", []))
+    sizes = [count_tokens(q.content) + count_tokens(a.content) for q, a in pairs]
+    total = sum(sizes)
+    dropped = []
+    while total > budget and len(dropped) < len(pairs) - 1:
+        total -= sizes[len(dropped)]
+        dropped.append(pairs[len(dropped)])
+    if not dropped:
+        return {}
+    kept_ids = {m.id for pair in pairs[len(dropped):] for m in pair}
+    removals = [RemoveMessage(id=m.id) for m in state["message"] if m.id not in kept_ids]
+    summary = _fold_into_summary(state.get("summary", ""), dropped, summarize if SESSION_SUMMARIZE else None)
+    return {"message": removals, "summary": summary}
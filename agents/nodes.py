@@ -1,59 +1,305 @@
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage
 from agents.state import StateAgent
 from prompts.prompts import (
     classify_prompt,
+    classify_batch_prompt,
     generate_prompt,
-    explain_prompt,
-    fallback_prompt
+    fallback_prompt,
+    summarize_prompt
 )
 from tools.tools import retriever
-from langchain_community.llms import Ollama
-from config.settings import OLLAMA_MODEL_NAME
-import re
-
-llm = Ollama(
-    model=OLLAMA_MODEL_NAME,  # We can also use 'deepseek-coder:6.7b' or 'llama2:7b'
-    temperature=0.2
+from utils.context_packer import count_tokens
+from utils import metrics
+from agents.classifier import classify, aclassify, parse_batch_labels
+from agents.history import compact, format_history, is_follow_up
+from agents import speculation
+from agents import explain
+from langgraph.config import get_stream_writer
+from utils.generation_control import CodeStopper, controlled, acontrolled
+from config.settings import (
+    MODEL_REGISTRY,
+    STOP_SEQUENCES,
+    GENERATION_EARLY_STOP,
+    BATCHING_ENABLED,
+    CLASSIFY_BATCH_WORKERS,
+    SESSION_SUMMARIZE,
+    SPECULATION_ROUTES
 )
+import asyncio
+import threading
+import time
+
+# When set, replaces every node's model (benchmarks install a stub LLM here)
+llm = None
+# One client per node, created on first use and shared by all requests; each spreads
+# its calls over the Ollama endpoints of utils.llm_pool
+_llms = {}
+_llm_lock = threading.Lock()
+
+def get_llm(node: str):
+    """Get the singleton client for ``node``'s model and options in MODEL_REGISTRY"""
+    if llm is not None:
+        return llm
+    if node not in _llms:
+        with _llm_lock:
+            if node not in _llms:
+                from utils.llm_pool import PooledLLM
+                options = dict(MODEL_REGISTRY[node])
+                _llms[node] = PooledLLM(model=options.pop('model'), options=options)
+    return _llms[node]
+
+def _stopper(node):
+    """Early stopping for generated code; other nodes run to the end"""
+    return CodeStopper(node) if node == 'generate_code' and GENERATION_EARLY_STOP else None
+
+def completion_stream(prompt: str, node: str):
+    """``node``'s token stream, with its stop sequences and early stopping"""
+    stream = get_llm(node).stream(prompt, stop=STOP_SEQUENCES.get(node))
+    stopper = _stopper(node)
+    return controlled(stream, stopper) if stopper else stream
+
+def acompletion_stream(prompt: str, node: str):
+    """Async counterpart of completion_stream"""
+    stream = get_llm(node).astream(prompt, stop=STOP_SEQUENCES.get(node))
+    stopper = _stopper(node)
+    return acontrolled(stream, stopper) if stopper else stream
+
+def stream_completion(prompt: str, node: str) -> str:
+    """Run ``node``'s LLM in streaming mode, forwarding each token to the graph's custom stream"""
+    client = get_llm(node)
+    writer = get_stream_writer()
+    chunks = []
+    first_token = None
+    with metrics.stage("llm", model=getattr(client, 'model', client._llm_type)) as span:
+        start = time.perf_counter()
+        for chunk in completion_stream(prompt, node):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            chunks.append(chunk)
+            writer(chunk)
+        output = "".join(chunks)
+        metrics.record_llm_call(span, prompt, output, first_token)
+    # Token counts also go on the calling node's span
+    metrics.annotate(**span.attributes)
+    return output
+
+async def astream_completion(prompt: str, node: str) -> str:
+    """Async counterpart of stream_completion"""
+    client = get_llm(node)
+    writer = get_stream_writer()
+    chunks = []
+    first_token = None
+    with metrics.stage("llm", model=getattr(client, 'model', client._llm_type)) as span:
+        start = time.perf_counter()
+        async for chunk in acompletion_stream(prompt, node):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            chunks.append(chunk)
+            writer(chunk)
+        output = "".join(chunks)
+        metrics.record_llm_call(span, prompt, output, first_token)
+    metrics.annotate(**span.attributes)
+    return output
+
+def classify_with_llm_batch(texts):
+    """One LLM call for all pending classifications; unparsed lines are retried concurrently"""
+    if len(texts) == 1:
+        return [get_llm('chat').invoke(classify_prompt(texts[0]))]
+    labels = parse_batch_labels(get_llm('chat').invoke(classify_batch_prompt(texts)), len(texts))
+    missing = [i for i, label in enumerate(labels) if label is None]
+    if missing:
+        retried = get_llm('chat').batch([classify_prompt(texts[i]) for i in missing])
+        for i, label in zip(missing, retried):
+            labels[i] = label
+    return labels
+
+_classify_batcher = None
+_classify_batcher_lock = threading.Lock()
+
+def get_classify_batcher():
+    """Get the singleton batcher that merges concurrent LLM classifications"""
+    global _classify_batcher
+    if _classify_batcher is None:
+        with _classify_batcher_lock:
+            if _classify_batcher is None:
+                from utils.batching import MicroBatcher
+                _classify_batcher = MicroBatcher(classify_with_llm_batch, name="classify-batcher",
+                                                 workers=CLASSIFY_BATCH_WORKERS)
+    return _classify_batcher
+
+def llm_classify(text: str) -> str:
+    if BATCHING_ENABLED:
+        return get_classify_batcher().submit(text)
+    return get_llm('chat').invoke(classify_prompt(text))
+
+async def allm_classify(text: str) -> str:
+    if BATCHING_ENABLED:
+        return await get_classify_batcher().asubmit(text)
+    return await get_llm('chat').ainvoke(classify_prompt(text))
+
+NO_CODE_MESSAGE = "I don't see any code in your input: '{}'. Please provide the Python code you'd like me to explain."
+
+def _classified(user_input, state, result):
+    """A follow-up the classifier cannot place continues the previous turn's task"""
+    metrics.annotate(tier=result.tier)
+    if result.task == 'unclear' and state.get('task') in ('generate', 'explain') and is_follow_up(user_input, state):
+        return {'task': state['task'], 'classification': f"{state['task']} (follow-up)"}
+    return {'task': result.task, 'classification': result.raw}
+
 def chat(state: StateAgent) -> StateAgent:
     user_input = state['message'][-1].content
-    prompt = classify_prompt(user_input)
-    result = llm.invoke(prompt)
-    raw = result.strip().lower()
-    match = re.search(r"(generate|explain|unclear)", raw)
-    task = match.group(1) if match else 'unclear'
-    return {**state, 'task': task, 'classification': raw}
+    return _classified(user_input, state, classify(user_input, llm_classify))
+
+def _speculate(user_input, state):
+    """Start the SPECULATION_ROUTES work for this question; returns its key, or None"""
+    # Follow-ups reuse the session's context, there is nothing to fetch ahead
+    key = speculation.session_key(user_input)
+    if key is None or is_follow_up(user_input, state):
+        return None
+    history = format_history(state)
+    if SPECULATION_ROUTES.get('generate'):
+        prompt_for = None
+        if SPECULATION_ROUTES['generate'] == 'generation':
+            prompt_for = lambda context: generate_prompt(user_input, context, history)
+        speculation.launch(key, 'generate', retrieve=lambda: retriever.ainvoke(user_input),
+                           prompt_for=prompt_for, stream=lambda prompt: acompletion_stream(prompt, 'generate_code'))
+    if SPECULATION_ROUTES.get('explain') == 'generation' and not _no_code(user_input, state):
+        analysis = explain.analyze(user_input)
+        # A snippet the templates cover is answered without the LLM anyway
+        if analysis is None or explain.template_explanation(analysis) is None:
+            speculation.launch(key, 'explain', prompt_for=lambda _: explain.build_prompt(user_input, analysis, history),
+                               stream=lambda prompt: acompletion_stream(prompt, 'explain_code'))
+    if SPECULATION_ROUTES.get('unclear') == 'generation':
+        speculation.launch(key, 'unclear', prompt_for=lambda _: fallback_prompt(user_input, history),
+                           stream=lambda prompt: acompletion_stream(prompt, 'fallback'))
+    return key
+
+async def achat(state: StateAgent) -> StateAgent:
+    user_input = state['message'][-1].content
+    key = None
+
+    async def speculate_and_classify(text):
+        # Only called when the cheap tiers cannot decide, i.e. the slow path worth overlapping
+        nonlocal key
+        key = _speculate(user_input, state)
+        return await allm_classify(text)
+
+    routed = _classified(user_input, state, await aclassify(user_input, speculate_and_classify))
+    if key is not None:
+        speculation.resolve(key, routed['task'])
+    return routed
 
 def router(state: StateAgent) -> str:
     return state['task']
 
+def _cached_context(user_input, state):
+    """The session's last retrieval context, when the question follows up on it"""
+    if state.get('context') and is_follow_up(user_input, state):
+        metrics.annotate(context_reused=True)
+        return state['context']
+    return None
+
 def generate_code(state: StateAgent) -> StateAgent:
     user_input = state['message'][-1].content
-    context = retriever(user_input)
-    prompt = generate_prompt(user_input, context)
-    output = llm.invoke(prompt)
-    return {
-        **state,
-        "message": state["message"] + [HumanMessage(content=prompt), SystemMessage(content=output)]
-    }
+    context = _cached_context(user_input, state) or retriever.invoke(user_input)
+    prompt = generate_prompt(user_input, context, format_history(state))
+    output = stream_completion(prompt, 'generate_code')
+    return {"message": [AIMessage(content=output)], "context": context, "prompt_tokens": count_tokens(prompt)}
+
+async def agenerate_code(state: StateAgent) -> StateAgent:
+    user_input = state['message'][-1].content
+    speculated = speculation.take(speculation.session_key(user_input), 'generate')
+    context = None
+    if speculated is not None:
+        try:
+            context = await speculated.context()
+        except Exception as e:
+            # Its generation was waiting on this retrieval and failed with it
+            print(f"Speculative retrieval failed, retrieving again: {e}")
+            metrics.annotate(speculation="failed")
+            speculated.cancel()
+            speculated = None
+    if speculated is None:
+        # The retriever is sync (embedding + Chroma); the tool runs it in a worker thread
+        context = _cached_context(user_input, state) or await retriever.ainvoke(user_input)
+    if speculated is not None and speculated.generation is not None:
+        prompt, output = await speculated.replay()
+    else:
+        prompt = generate_prompt(user_input, context, format_history(state))
+        output = await astream_completion(prompt, 'generate_code')
+    return {"message": [AIMessage(content=output)], "context": context, "prompt_tokens": count_tokens(prompt)}
+
+def _no_code(user_input, state):
+    # A follow-up can refer to code from an earlier turn, which the prompt's history carries
+    return not explain.has_code(user_input) and not is_follow_up(user_input, state)
+
+def _quick_explanation(user_input, state):
+    """(analysis, answer): the code's analysis, plus a cached or template answer when one exists"""
+    # A follow-up's code may be in the history, so it gets the full prompt
+    analysis = None if is_follow_up(user_input, state) else explain.analyze(user_input)
+    output = explain.quick_answer(analysis) if analysis is not None else None
+    if output is not None:
+        get_stream_writer()(output)
+    return analysis, output
 
 def explain_code(state: StateAgent) -> StateAgent:
     user_input = state['message'][-1].content
-    if not any(k in user_input.lower() for k in ['def ', 'class ', 'import ', 'for ', 'if ', 'while ', '=', 'print', 'return']):
-        output = f"I don't see any code in your input: '{user_input}'. Please provide the Python code you'd like me to explain."
-        return {**state, "message": state["message"] + [SystemMessage(content=output)]}
-    prompt = explain_prompt(user_input)
-    output = llm.invoke(prompt)
-    return {
-        **state,
-        "message": state["message"] + [HumanMessage(content=prompt), SystemMessage(content=output)]
-    }
+    if _no_code(user_input, state):
+        output = NO_CODE_MESSAGE.format(user_input)
+        get_stream_writer()(output)
+        return {"message": [AIMessage(content=output)]}
+    analysis, output = _quick_explanation(user_input, state)
+    if output is not None:
+        return {"message": [AIMessage(content=output)], "prompt_tokens": 0}
+    prompt = explain.build_prompt(user_input, analysis, format_history(state))
+    output = stream_completion(prompt, 'explain_code')
+    explain.remember(analysis, output)
+    return {"message": [AIMessage(content=output)], "prompt_tokens": count_tokens(prompt)}
+
+async def aexplain_code(state: StateAgent) -> StateAgent:
+    user_input = state['message'][-1].content
+    if _no_code(user_input, state):
+        output = NO_CODE_MESSAGE.format(user_input)
+        get_stream_writer()(output)
+        return {"message": [AIMessage(content=output)]}
+    key = speculation.session_key(user_input)
+    analysis, output = _quick_explanation(user_input, state)
+    if output is not None:
+        if key is not None:
+            # Drop a speculative answer started before the cache had this one
+            speculation.resolve(key, None)
+        return {"message": [AIMessage(content=output)], "prompt_tokens": 0}
+    speculated = speculation.take(key, 'explain')
+    if speculated is not None:
+        prompt, output = await speculated.replay()
+    else:
+        prompt = explain.build_prompt(user_input, analysis, format_history(state))
+        output = await astream_completion(prompt, 'explain_code')
+    explain.remember(analysis, output)
+    return {"message": [AIMessage(content=output)], "prompt_tokens": count_tokens(prompt)}
 
 def fallback(state: StateAgent) -> StateAgent:
     user_input = state['message'][-1].content
-    prompt = fallback_prompt(user_input)
-    output = llm.invoke(prompt)
-    return {
-        **state,
-        "message": state["message"] + [SystemMessage(content=output)]
-    }
+    prompt = fallback_prompt(user_input, format_history(state))
+    output = stream_completion(prompt, 'fallback')
+    return {"message": [AIMessage(content=output)], "prompt_tokens": count_tokens(prompt)}
+
+async def afallback(state: StateAgent) -> StateAgent:
+    user_input = state['message'][-1].content
+    speculated = speculation.take(speculation.session_key(user_input), 'unclear')
+    if speculated is not None:
+        prompt, output = await speculated.replay()
+    else:
+        prompt = fallback_prompt(user_input, format_history(state))
+        output = await astream_completion(prompt, 'fallback')
+    return {"message": [AIMessage(content=output)], "prompt_tokens": count_tokens(prompt)}
+
+def compact_history(state: StateAgent) -> StateAgent:
+    """Keep the session history within SESSION_HISTORY_TOKEN_BUDGET"""
+    return compact(state, summarize=lambda summary, text: get_llm('compact_history').invoke(summarize_prompt(summary, text)))
+
+async def acompact_history(state: StateAgent) -> StateAgent:
+    if SESSION_SUMMARIZE:
+        # Summarizing calls the LLM; keep it off the event loop
+        return await asyncio.to_thread(compact_history, state)
+    return compact(state)
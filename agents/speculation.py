@@ -0,0 +1,168 @@
+"""Speculative routing: start a route's work while the LLM tier classifies.
+
+Only inputs that fall through to the LLM classifier are worth it; the rules and
+embedding tiers decide in milliseconds. ``chat`` launches the routes enabled in
+SPECULATION_ROUTES, keyed by (session, question); once the router has decided, the
+other routes are cancelled and the chosen node picks its speculation up with
+``take``. Speculative answers are buffered, never streamed, until their route is
+confirmed. Async graph only.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from langgraph.config import get_config, get_stream_writer
+from utils import metrics
+
+# Launched speculations nobody picked up (e.g. a cancelled request) are dropped past this
+MAX_PENDING = 256
+
+
+class Speculation:
+    """Retrieval and/or a buffered LLM answer for one route, running as asyncio tasks"""
+
+    def __init__(self, route, retrieve=None, prompt_for=None, stream=None):
+        self.route = route
+        self.started = time.perf_counter()
+        self.finished = None
+        self.chunks = asyncio.Queue()
+        self.llm_attributes = {}
+        self.retrieval = asyncio.create_task(retrieve()) if retrieve else None
+        self.generation = asyncio.create_task(self._generate(prompt_for, stream)) if prompt_for else None
+        last = self.generation or self.retrieval
+        last.add_done_callback(self._done)
+
+    def _done(self, task):
+        self.finished = time.perf_counter()
+        # Failures surface when the node awaits the task; a discarded one must not warn
+        if not task.cancelled():
+            task.exception()
+
+    async def _generate(self, prompt_for, stream):
+        try:
+            context = await self.retrieval if self.retrieval else None
+            prompt = prompt_for(context)
+            chunks, first_token = [], None
+            with metrics.stage("speculative_llm", route=self.route) as span:
+                start = time.perf_counter()
+                async for chunk in stream(prompt):
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    chunks.append(chunk)
+                    self.chunks.put_nowait(chunk)
+                output = "".join(chunks)
+                metrics.record_llm_call(span, prompt, output, first_token)
+            self.llm_attributes = span.attributes
+            return prompt, output
+        finally:
+            self.chunks.put_nowait(None)
+
+    async def context(self):
+        return await self.retrieval if self.retrieval else None
+
+    async def replay(self):
+        """Forward the buffered answer to the node's stream as it arrives; return (prompt, output)"""
+        writer = get_stream_writer()
+        while (chunk := await self.chunks.get()) is not None:
+            writer(chunk)
+        prompt, output = await self.generation
+        metrics.annotate(**self.llm_attributes)
+        return prompt, output
+
+    def cancel(self):
+        for task in (self.retrieval, self.generation):
+            if task is not None:
+                task.cancel()
+
+
+class SpeculationStats:
+    """Thread-safe per-route hit counters and latency saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.launched = {}
+        self.hits = {}
+        self.saved = {}
+
+    def record_launch(self, route):
+        with self._lock:
+            self.launched[route] = self.launched.get(route, 0) + 1
+
+    def record_hit(self, route, saved):
+        with self._lock:
+            self.hits[route] = self.hits.get(route, 0) + 1
+            self.saved[route] = self.saved.get(route, 0.0) + saved
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {}
+            for route, launched in self.launched.items():
+                hits = self.hits.get(route, 0)
+                routes[route] = {
+                    'launched': launched,
+                    'hits': hits,
+                    'hit_rate': hits / launched,
+                    'avg_saved_ms': 1000 * self.saved.get(route, 0.0) / hits if hits else 0.0,
+                    'total_saved_s': self.saved.get(route, 0.0),
+                }
+            return routes
+
+
+stats = SpeculationStats()
+_pending = OrderedDict()
+_lock = threading.Lock()
+
+
+def session_key(question):
+    """(thread_id or trace_id, question) for the running graph; None outside a session"""
+    configurable = get_config().get("configurable", {})
+    session = configurable.get("thread_id") or configurable.get("trace_id")
+    return (session, question) if session else None
+
+
+def launch(key, route, retrieve=None, prompt_for=None, stream=None):
+    """Start speculative work for ``route``: ``retrieve()`` is a coroutine function returning
+    the context, ``prompt_for(context)`` builds the prompt and ``stream(prompt)`` yields the answer"""
+    speculation = Speculation(route, retrieve, prompt_for, stream)
+    stats.record_launch(route)
+    evicted = []
+    with _lock:
+        _pending.setdefault(key, {})[route] = speculation
+        _pending.move_to_end(key)
+        while len(_pending) > MAX_PENDING:
+            evicted.extend(_pending.popitem(last=False)[1].values())
+    for stale in evicted:
+        stale.cancel()
+
+
+def resolve(key, route):
+    """The router chose ``route``: cancel the speculation for every other route"""
+    with _lock:
+        launched = _pending.get(key, {})
+        losers = [launched.pop(r) for r in list(launched) if r != route]
+        if not launched:
+            _pending.pop(key, None)
+    for speculation in losers:
+        speculation.cancel()
+
+
+def take(key, route):
+    """Hand the confirmed route's speculation to its node, recording the time saved"""
+    if key is None:
+        return None
+    with _lock:
+        launched = _pending.get(key, {})
+        speculation = launched.pop(route, None)
+        if not launched:
+            _pending.pop(key, None)
+    if speculation is None:
+        return None
+    now = time.perf_counter()
+    # Work done before the node started is latency the request no longer waits for
+    saved = min(now, speculation.finished or now) - speculation.started
+    stats.record_hit(route, saved)
+    metrics.annotate(speculation="hit", speculation_saved_ms=round(1000 * saved, 1))
+    return speculation
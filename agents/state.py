@@ -1,8 +1,12 @@
 from typing import TypedDict, Annotated, Sequence
 from langchain_core.messages import BaseMessage
-from operator import add as add_messages
+from langgraph.graph.message import add_messages
 
 class StateAgent(TypedDict):
+    # Compact history: one HumanMessage (question) and one AIMessage (answer) per turn
     message: Annotated[Sequence[BaseMessage], add_messages]
     task: str  # 'generate', 'explain', or 'fallback'
     classification: str
+    prompt_tokens: int  # size of the last prompt sent to the LLM
+    summary: str  # turns that no longer fit the history budget
+    context: str  # retrieval context of the last generate turn, reused by follow-ups
@@ -1,30 +1,126 @@
-import gradio as gr
-from langchain_core.messages import HumanMessage
-from graph.conditional_graph import get_app
+import asyncio
+import threading
+import time
+import uuid
+from langchain_core.messages import AIMessage, HumanMessage
+from agents.history import looks_like_follow_up
+from utils.semantic_cache import get_semantic_cache
+from utils import metrics
+from utils.startup import readiness, start_background_warm_up
+from config.settings import GRADIO_CONCURRENCY_LIMIT, GRADIO_MAX_QUEUE_SIZE, SESSION_DB_PATH
 
-# Initialize the app once
-app = get_app()
+# The graph (and the langgraph import behind it) is built on first use, once
+_graph = None
+_graph_lock = threading.Lock()
 
-def process_question(username, question):
-    """Process the user's question and return classification and answer"""
+def get_graph():
+    """Get the graph, checkpointing each user's conversation to SESSION_DB_PATH"""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                import aiosqlite
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+                from graph.conditional_graph import get_app
+                _graph = get_app(checkpointer=AsyncSqliteSaver(aiosqlite.connect(SESSION_DB_PATH)))
+    return _graph
+
+async def close_sessions():
+    """Close the session database; its connection thread would otherwise keep the process alive"""
+    if _graph is not None:
+        await _graph.checkpointer.conn.close()
+
+ANSWER_NODES = ("generate_code", "explain_code", "fallback")
+
+def session_config(username, trace):
+    # One conversation thread per user name; nameless requests get a throwaway thread
+    thread_id = username.strip() if username and username.strip() else uuid.uuid4().hex
+    return {"configurable": {"thread_id": thread_id, "trace_id": trace.trace_id}}
+
+async def process_question(username, question, trace=None):
+    """Stream the classification and the answer as they are produced.
+
+    Yields (classification, partial_answer) pairs: the classification appears as soon
+    as the chat node finishes and the answer grows token by token. The graph runs on
+    the event loop, so concurrent users do not serialize behind each other.
+    Each username is one conversation whose compact history the graph checkpoints.
+    Per-stage timings are recorded on ``trace`` (a new one if not given).
+    """
     if not question.strip():
-        return "", "Please enter a question!"
+        yield "", "Please enter a question!"
+        return
     
+    start = time.perf_counter()
+    trace = trace or metrics.start_trace()
+    config = session_config(username, trace)
+    # A follow-up's answer depends on the conversation, so it is neither looked up nor cached
+    cache = None if looks_like_follow_up(question) else get_semantic_cache()
+    cached = None
     try:
-        # Invoke the langchain app
-        result = app.invoke({"message": [HumanMessage(content=question)]})
-        
-        # Extract classification and answer
-        classification = result.get('classification', 'unknown').upper()
-        answer = result['message'][-1].content
-        
-        return classification, answer
+        if cache:
+            with metrics.use_trace(trace), metrics.stage("semantic_cache"):
+                cached = await asyncio.to_thread(cache.lookup, question)
+    except Exception as e:
+        print(f"[cache] lookup failed, bypassing semantic cache: {e}")
+        cache, cached = None, None
+    if cached:
+        print(f"[cache] semantic cache hit in {time.perf_counter() - start:.3f}s {cache.stats()}")
+        metrics.finish_trace(trace, cache_hit=True)
+        yield cached
+        await record_cached_turn(config, question, *cached)
+        return
+    
+    classification, answer = "", ""
+    prompt_tokens = None
+    first_token_at = None
+    try:
+        # Stream node updates (for the classification) and custom events (LLM tokens)
+        async for mode, chunk in get_graph().astream(
+            {"message": [HumanMessage(content=question)]},
+            config,
+            stream_mode=["updates", "custom"]
+        ):
+            if mode == "custom":
+                if first_token_at is None:
+                    first_token_at = time.perf_counter() - start
+                answer += chunk
+            elif "chat" in chunk:
+                classification = chunk["chat"].get('classification', 'unknown').upper()
+            else:
+                node, update = next(iter(chunk.items()))
+                if node not in ANSWER_NODES:
+                    continue
+                # A branch node finished: its message is the complete answer
+                answer = update['message'][-1].content
+                prompt_tokens = update.get('prompt_tokens')
+            yield classification, answer
         
     except Exception as e:
-        return "ERROR", f"⚠️ Error: {str(e)}"
+        metrics.finish_trace(trace, error=str(e))
+        yield "ERROR", f"⚠️ Error: {str(e)}"
+        return
+    
+    if cache:
+        await asyncio.to_thread(cache.store, question, classification, answer)
+    total = time.perf_counter() - start
+    metrics.finish_trace(trace, classification=classification, first_token_seconds=first_token_at)
+    ttft = f"{first_token_at:.2f}s" if first_token_at is not None else "n/a"
+    print(f"[latency] time to first token: {ttft}, total: {total:.2f}s, prompt tokens: {prompt_tokens}")
+
+async def record_cached_turn(config, question, classification, answer):
+    """Add a turn answered from the semantic cache to the user's session history"""
+    task = classification.lower()
+    update = {"message": [HumanMessage(content=question), AIMessage(content=answer)], "context": ""}
+    if task in ("generate", "explain", "unclear"):
+        update["task"] = task
+    try:
+        await get_graph().aupdate_state(config, update, as_node="compact_history")
+    except Exception as e:
+        print(f"[session] could not record cached answer: {e}")
 
 def create_interface():
     """Create the Gradio interface"""
+    import gradio as gr
     
     with gr.Blocks(title="Smart Code Assistant", theme=gr.themes.Soft()) as demo:
         # Store username in state
@@ -78,6 +174,10 @@ def create_interface():
                         lines=10
                     )
                 
+                # Where the time went in the last request
+                with gr.Accordion("🔬 Debug: last request", open=False):
+                    debug_output = gr.JSON(label="Per-stage breakdown")
+                
                 # Reset button
                 with gr.Row():
                     reset_btn = gr.Button("Start Over", variant="secondary", size="sm")
@@ -97,14 +197,17 @@ def create_interface():
                 name  # Store username in state
             )
         
-        def ask_question(username, question):
+        async def ask_question(username, question):
             """Handle question submission"""
             if not question.strip():
                 gr.Warning("Please enter a question!")
-                return "", ""
+                yield "", "", gr.update()
+                return
             
-            classification, answer = process_question(username, question)
-            return classification, answer
+            trace = metrics.start_trace()
+            async for classification, answer in process_question(username, question, trace):
+                yield classification, answer, gr.update()
+            yield classification, answer, trace.breakdown()
         
         def clear_inputs():
             """Clear the input fields"""
@@ -133,7 +236,7 @@ def create_interface():
         submit_btn.click(
             ask_question,
             inputs=[username_state, question_input],
-            outputs=[classification_output, answer_output]
+            outputs=[classification_output, answer_output, debug_output]
         )
         
         clear_btn.click(
@@ -157,24 +260,55 @@ def create_interface():
         question_input.submit(
             ask_question,
             inputs=[username_state, question_input],
-            outputs=[classification_output, answer_output]
+            outputs=[classification_output, answer_output, debug_output]
         )
     
     return demo
 
 def main():
     """Launch the Gradio app"""
+    import gradio as gr
+    import uvicorn
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
     print("=== LAUNCHING SMART CODE ASSISTANT WEB APP ===")
     
     demo = create_interface()
+    demo.queue(
+        default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT,
+        max_size=GRADIO_MAX_QUEUE_SIZE
+    )
+    
+    @asynccontextmanager
+    async def lifespan(_):
+        yield
+        await close_sessions()
+    
+    # Readiness probe: 503 until the models and indexes have been warmed up
+    server = FastAPI(lifespan=lifespan)
+    
+    @server.get("/ready")
+    def ready():
+        status = readiness()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+    
+    # Stage latency and token histograms for Prometheus
+    @server.get("/metrics")
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+    
+    server = gr.mount_gradio_app(server, demo, path="/")
+    
+    # The UI is usable right away; models load in the background (or on first use)
+    start_background_warm_up()
     
     # Launch the app
-    demo.launch(
-        server_name="0.0.0.0",  # Allow external access
-        server_port=7860,       # Default Gradio port
-        share=False,            # Set to True for public sharing
-        debug=True              # Enable debug mode
+    uvicorn.run(
+        server,
+        host="0.0.0.0",  # Allow external access
+        port=7860        # Default Gradio port
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,176 @@
+"""Offline batch jobs: run a JSONL file of questions through the graph.
+
+    python -m batch.runner questions.jsonl answers.jsonl --concurrency 8
+
+Each input line is {"question": ...} or {"file": "path.py"} (explain a whole module),
+with an optional "id" (default: the line number). Identical questions, up to
+whitespace, run once and every copy gets the answer. Results are appended to the
+output file as they finish, with per-item and per-stage timings, so the output is
+also the checkpoint: running the same command again skips the items that already
+succeeded and retries the failed ones. The semantic cache and conversation
+sessions are bypassed; every question is answered on its own.
+
+From Python::
+
+    from batch.runner import run_batch
+    summary = run_batch("questions.jsonl", "answers.jsonl", concurrency=8)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from config.settings import BATCH_JOB_CONCURRENCY, BATCH_JOB_TIMEOUT_SECONDS
+
+EXPLAIN_FILE = "explain this code:\n{}"
+
+
+def read_items(path):
+    """Input items with their id and question resolved"""
+    items = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "question" not in item:
+                with open(item["file"]) as source:
+                    item["question"] = EXPLAIN_FILE.format(source.read())
+            item.setdefault("id", str(number))
+            items.append(item)
+    return items
+
+
+def question_key(question):
+    """Identical questions up to whitespace share a key"""
+    return hashlib.sha256(" ".join(question.split()).encode()).hexdigest()[:16]
+
+
+def read_results(path):
+    """Successful results already in ``path``, by item id; a line cut off by a crash is dropped"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            f.truncate(complete)
+    done = {}
+    for line in data[:complete].decode().splitlines():
+        result = json.loads(line)
+        if result.get("error") is None:
+            done[result["id"]] = result
+        else:
+            done.pop(result["id"], None)
+    return done
+
+
+async def answer(app, question, timeout):
+    """Run one question through the graph; returns the result fields"""
+    from langchain_core.messages import HumanMessage
+    from utils import metrics
+    trace = metrics.start_trace("batch")
+    start = time.perf_counter()
+    try:
+        state = await asyncio.wait_for(app.ainvoke(
+            {"message": [HumanMessage(content=question)]},
+            {"configurable": {"trace_id": trace.trace_id}}
+        ), timeout)
+    except Exception as e:
+        metrics.finish_trace(trace, error=str(e))
+        error = f"timed out after {timeout}s" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+        return {"error": error, "seconds": round(time.perf_counter() - start, 4)}
+    metrics.finish_trace(trace, classification=state.get("classification"))
+    stages = {}
+    for row in trace.breakdown()[1:]:
+        stages[row["stage"]] = round(stages.get(row["stage"], 0.0) + row["seconds"], 4)
+    return {
+        "task": state.get("task"),
+        "classification": state.get("classification"),
+        "answer": state["message"][-1].content,
+        "error": None,
+        "seconds": round(time.perf_counter() - start, 4),
+        "prompt_tokens": state.get("prompt_tokens"),
+        "stages": stages,
+    }
+
+
+async def arun_batch(items, output_path, concurrency=BATCH_JOB_CONCURRENCY,
+                     timeout=BATCH_JOB_TIMEOUT_SECONDS, app=None):
+    """Answer ``items`` (dicts with "id" and "question") into ``output_path``; returns a summary"""
+    if app is None:
+        from graph.conditional_graph import get_app
+        app = get_app()
+    done = read_results(output_path)
+    answered = {question_key(result["question"]): result for result in done.values()}
+    groups = {}
+    for item in items:
+        if item["id"] not in done:
+            groups.setdefault(question_key(item["question"]), []).append(item)
+
+    counts = {"items": len(items), "resumed": len(done), "answered": 0, "deduplicated": 0, "errors": 0}
+    start = time.perf_counter()
+    with open(output_path, "a") as output:
+
+        def write(item, result, duplicate_of=None):
+            row = {"id": item["id"], "question": item["question"], **result}
+            if duplicate_of is not None:
+                row["duplicate_of"] = duplicate_of
+            output.write(json.dumps(row) + "\n")
+            output.flush()
+            if result["error"] is not None:
+                counts["errors"] += 1
+            elif duplicate_of is None:
+                counts["answered"] += 1
+            else:
+                counts["deduplicated"] += 1
+
+        # Questions answered by an earlier run only need their copies written
+        pending = []
+        for key, group in groups.items():
+            if key in answered:
+                previous = answered[key]
+                for item in group:
+                    write(item, {name: value for name, value in previous.items()
+                                 if name not in ("id", "question", "duplicate_of")}, previous["id"])
+            else:
+                pending.append(group)
+        queue = iter(pending)
+        progress = {"finished": 0, "failed": 0}
+
+        async def worker():
+            for group in queue:
+                result = await answer(app, group[0]["question"], timeout)
+                write(group[0], result)
+                for item in group[1:]:
+                    write(item, result, group[0]["id"])
+                progress["finished"] += 1
+                progress["failed"] += result["error"] is not None
+                if progress["finished"] % 10 == 0 or progress["finished"] == len(pending):
+                    print(f"[batch] {progress['finished']}/{len(pending)} questions, {progress['failed']} failed, "
+                          f"{progress['finished'] / (time.perf_counter() - start):.2f}/s")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(pending))))))
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    return counts
+
+
+def run_batch(input_path, output_path, concurrency=BATCH_JOB_CONCURRENCY,
+              timeout=BATCH_JOB_TIMEOUT_SECONDS, app=None):
+    """Synchronous entry point: answer every question in ``input_path`` into ``output_path``"""
+    return asyncio.run(arun_batch(read_items(input_path), output_path, concurrency, timeout, app))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL of {\"question\": ...} or {\"file\": ...}, optional \"id\"")
+    parser.add_argument("output", help="JSONL results; also the checkpoint a rerun resumes from")
+    parser.add_argument("--concurrency", type=int, default=BATCH_JOB_CONCURRENCY,
+                        help="Questions in flight (default: 4 per Ollama endpoint)")
+    parser.add_argument("--timeout", type=float, default=BATCH_JOB_TIMEOUT_SECONDS, help="Seconds per question")
+    args = parser.parse_args()
+
+    summary = run_batch(args.input, args.output, args.concurrency, args.timeout)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,195 @@
+"""Offline benchmark of the full assistant graph, for comparing commits.
+
+    python -m benchmarks.bench_graph --concurrency 4 --repeat 5 --output results.json
+
+Drives ``get_app()`` with the recorded workload in ``benchmarks/workload.jsonl``
+(mixed generate/explain/unclear questions). The LLM is ``StubLLM`` and retrieval
+runs against a fixture vectorstore built with deterministic fake embeddings in a
+temporary directory, so no Ollama, embedding model or dataset download is needed.
+Prints JSON with throughput, p50/p95/p99 latency per route and per stage (graph
+nodes plus retriever, embedding and llm), completion tokens per route, early
+stops, explain fast-path counts, speculation and retriever cache hit rates, and the
+memory high-water mark.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from benchmarks.load_test import percentile
+
+WORKLOAD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload.jsonl")
+
+
+def load_workload(path=WORKLOAD_PATH):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "mean_s": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+    }
+
+
+def build_fixture(lines, embedding_size):
+    """Index a synthetic corpus with fake embeddings into the (temporary) PERSIST_DIR"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import vectorstore.retriever as retriever_module
+    from vectorstore.builder import index_documents
+    from benchmarks.bench_splitter import synthetic_documents
+    retriever_module._embedding_model = retriever_module.wrap_embeddings(
+        DeterministicFakeEmbedding(size=embedding_size)
+    )
+    return index_documents(synthetic_documents(lines), corpus="fixture",
+                           vectorstore=retriever_module.get_vectorstore())
+
+
+async def run_workload(app, items, concurrency):
+    """Run every item through the graph; returns (item, route, seconds, trace) tuples"""
+    from langchain_core.messages import HumanMessage
+    from utils import metrics
+
+    pending = iter(items)
+    results = []
+
+    async def worker():
+        for item in pending:
+            trace = metrics.start_trace()
+            start = time.perf_counter()
+            state = await app.ainvoke(
+                {"message": [HumanMessage(content=item["question"])]},
+                {"configurable": {"trace_id": trace.trace_id}}
+            )
+            seconds = time.perf_counter() - start
+            metrics.finish_trace(trace)
+            results.append((item, state["task"], seconds, trace))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(WORKLOAD_PATH)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", default=WORKLOAD_PATH)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the workload")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes before measuring")
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--fixture-lines", type=int, default=5000, help="Size of the fixture corpus")
+    parser.add_argument("--embedding-size", type=int, default=384)
+    parser.add_argument("--speculation", choices=["off", "retrieval", "generation"],
+                        help="Speculative work for the generate route (default: SPECULATION_ROUTES)")
+    parser.add_argument("--early-stop", choices=["on", "off"],
+                        help="Cut generated code after the function (default: GENERATION_EARLY_STOP)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the Python heap peak (slower)")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    workload = load_workload(args.workload)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as fixture_dir:
+        # Must be set before config.settings is imported
+        os.environ["PERSIST_DIR"] = os.path.join(fixture_dir, "chroma")
+        os.environ["BM25_INDEX_PATH"] = os.path.join(fixture_dir, "bm25_index.json")
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+        fixture = build_fixture(args.fixture_lines, args.embedding_size)
+        from config.settings import SPECULATION_ROUTES
+        if args.speculation:
+            SPECULATION_ROUTES["generate"] = None if args.speculation == "off" else args.speculation
+        import config.settings
+        if args.early_stop:
+            config.settings.GENERATION_EARLY_STOP = args.early_stop == "on"
+        import agents.nodes
+        from utils import generation_control
+        from agents import speculation, explain
+        from vectorstore.retriever import cache_stats
+        from benchmarks.stub_llm import StubLLM
+        from graph.conditional_graph import get_app
+        agents.nodes.llm = StubLLM(first_token_latency=args.first_token_latency,
+                                   tokens_per_second=args.tokens_per_second)
+        app = get_app()
+
+        async def run_all():
+            if args.warmup:
+                await run_workload(app, workload * args.warmup, args.concurrency)
+            if args.tracemalloc:
+                tracemalloc.start()
+            speculation.stats.reset()
+            generation_control.stats.reset()
+            explain.stats.reset()
+            start = time.perf_counter()
+            results = await run_workload(app, workload * args.repeat, args.concurrency)
+            return results, time.perf_counter() - start
+
+        results, elapsed = asyncio.run(run_all())
+
+    by_route, by_stage, tokens = defaultdict(list), defaultdict(list), defaultdict(list)
+    for _, route, seconds, trace in results:
+        by_route[route].append(seconds)
+        for span in trace.spans[1:]:
+            by_stage[span.name].append(span.duration)
+            if span.name in ("llm", "speculative_llm") and "completion_tokens" in span.attributes:
+                tokens[route].append(span.attributes["completion_tokens"])
+    memory = {"max_rss_mb": round(max_rss_mb(), 1)}
+    if args.tracemalloc:
+        memory["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+
+    report = {
+        "commit": git_commit(),
+        "config": {
+            "requests": len(results),
+            "concurrency": args.concurrency,
+            "first_token_latency": args.first_token_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "fixture_chunks": fixture["chunks"],
+            "speculation_routes": SPECULATION_ROUTES,
+            "early_stop": config.settings.GENERATION_EARLY_STOP,
+        },
+        "throughput_rps": len(results) / elapsed,
+        "latency": summarize([seconds for _, _, seconds, _ in results]),
+        "misrouted": sum(1 for item, route, _, _ in results if item.get("route") not in (None, route)),
+        "routes": {route: summarize(values) for route, values in sorted(by_route.items())},
+        "stages": {stage: summarize(values) for stage, values in sorted(by_stage.items())},
+        "avg_completion_tokens": {route: sum(values) / len(values) for route, values in sorted(tokens.items())},
+        "early_stops": generation_control.stats.snapshot(),
+        "speculation": speculation.stats.snapshot(),
+        "explain": explain.stats.snapshot(),
+        "retriever_caches": cache_stats(),
+        "memory": memory,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
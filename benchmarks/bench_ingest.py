@@ -0,0 +1,64 @@
+"""Embedding throughput: single in-process model vs the parallel ingestion pipeline.
+
+    python -m benchmarks.bench_ingest PATH --workers 2 4 --batch-size 64
+
+Chunks come from the source files under PATH (split like build_vectorstore does);
+nothing is written to the vectorstore.
+"""
+import argparse
+import json
+import time
+from vectorstore.builder import iter_chunks
+from vectorstore.ingest import iter_directory_documents, parallel_embed
+
+
+def load_chunks(path, limit):
+    chunks = []
+    for item in iter_chunks(iter_directory_documents(path), corpus="bench"):
+        chunks.append(item)
+        if limit and len(chunks) >= limit:
+            break
+    return chunks
+
+
+def bench_single(chunks, batch_size):
+    """The current path: one HuggingFaceEmbeddings instance, batches in input order"""
+    from vectorstore.retriever import get_embedding_model
+    model = get_embedding_model()
+    model.embed_documents([chunks[0][1].page_content])  # exclude model load from the timing
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch_size):
+        model.embed_documents([doc.page_content for _, doc in chunks[i:i + batch_size]])
+    return time.perf_counter() - start
+
+
+def bench_parallel(chunks, workers, batch_size, max_seq_length):
+    # Includes worker start-up and model loading, which a real ingestion pays too
+    start = time.perf_counter()
+    for _ in parallel_embed(iter(chunks), workers, batch_size, max_seq_length):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-seq-length", type=int, default=512)
+    parser.add_argument("--limit", type=int, default=2000, help="Maximum number of chunks (0 for all)")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.path, args.limit)
+    results = [{"pipeline": "single", "workers": 1, "seconds": bench_single(chunks, args.batch_size)}]
+    for workers in args.workers:
+        seconds = bench_parallel(chunks, workers, args.batch_size, args.max_seq_length)
+        results.append({"pipeline": "parallel", "workers": workers, "seconds": seconds})
+    for result in results:
+        result["chunks"] = len(chunks)
+        result["chunks_per_sec"] = len(chunks) / result["seconds"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Chunking speed and shape: the AST chunker vs the original regex splitter.
+
+    python -m benchmarks.bench_splitter [PATH] [--lines 100000]
+
+Without PATH a synthetic repository of roughly ``--lines`` lines is generated.
+"""
+import argparse
+import json
+import re
+import time
+from langchain_core.documents import Document
+from utils.code_splitter import iter_code_chunks
+from vectorstore.ingest import iter_directory_documents
+
+SYNTHETIC_MODULE = '''import os
+from typing import List
+
+LIMIT = 10
+
+
+@cache
+def top_level_{i}(values: List[int],
+                  limit: int = LIMIT) -> List[int]:
+    """Keep values under the limit."""
+    return [v for v in values if v < limit]
+
+
+class Worker{i}:
+    """Processes items."""
+    retries = 3
+
+    def __init__(self, name):
+        self.name = name
+
+    async def run(self, items):
+        for item in items:
+            await self.handle(item)
+        return len(items)
+'''
+
+
+def regex_split(doc):
+    """The splitter this repo used before the AST chunker"""
+    text = doc.page_content
+    matches = list(re.finditer(r"^def\s+\w+\(.*?\):", text, re.MULTILINE))
+    if not matches:
+        return [doc]
+    starts = [m.start() for m in matches] + [len(text)]
+    return [
+        Document(page_content=text[starts[i]:starts[i+1]].strip(), metadata=doc.metadata)
+        for i in range(len(starts) - 1)
+    ]
+
+
+def synthetic_documents(total_lines):
+    lines_per_module = SYNTHETIC_MODULE.count("\n")
+    return [
+        Document(page_content=SYNTHETIC_MODULE.format(i=i), metadata={"id": f"module_{i}.py"})
+        for i in range(max(1, total_lines // lines_per_module))
+    ]
+
+
+def measure(name, split, documents):
+    start = time.perf_counter()
+    chunks = [chunk for doc in documents for chunk in split(doc)]
+    seconds = time.perf_counter() - start
+    sizes = [chunk.page_content.count("\n") + 1 for chunk in chunks]
+    return {
+        "splitter": name,
+        "seconds": seconds,
+        "chunks": len(chunks),
+        "avg_chunk_lines": sum(sizes) / len(sizes) if sizes else 0,
+        "max_chunk_lines": max(sizes, default=0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--lines", type=int, default=100_000)
+    args = parser.parse_args()
+
+    documents = list(iter_directory_documents(args.path)) if args.path else synthetic_documents(args.lines)
+    total_lines = sum(doc.page_content.count("\n") + 1 for doc in documents)
+    results = [
+        measure("regex", regex_split, documents),
+        measure("ast", iter_code_chunks, documents),
+    ]
+    print(json.dumps({"files": len(documents), "lines": total_lines, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Start-up cost: `import app` and building the graph with get_app().
+
+    python -m benchmarks.bench_startup [--top 15]
+
+Each measurement runs in a fresh interpreter. The import report comes from
+``python -X importtime`` and lists the slowest top-level packages by cumulative time.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+GET_APP_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "from graph.conditional_graph import get_app; get_app(); "
+    "print(time.perf_counter() - start)"
+)
+IMPORT_APP_SNIPPET = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+
+
+def run(snippet, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", snippet]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(report, top, exclude=("app",)):
+    """Parse -X importtime output into the packages with the largest cumulative time"""
+    packages = {}
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        if package not in exclude:
+            packages[package] = max(packages.get(package, 0), int(cumulative))
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": us / 1000} for name, us in ranked]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_seconds, report = run(IMPORT_APP_SNIPPET, importtime=True)
+    get_app_seconds, _ = run(GET_APP_SNIPPET)
+    print(json.dumps({
+        "import_app_s": import_seconds,
+        "get_app_s": get_app_seconds,
+        "slowest_imports_for_app": slowest_imports(report, args.top),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Dense search latency, open time, memory and recall: Chroma vs the mmap index.
+
+    python -m benchmarks.bench_vectorstore --rows 50000 --dim 768 --queries 200
+
+A synthetic collection of clustered unit vectors is written to a temporary Chroma
+store and exported to mmap indexes (float16, int8 and float16 with IVF lists).
+Each backend is measured in a fresh process so RSS figures are not shared;
+recall@k is against exact float32 search.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from benchmarks.load_test import percentile
+
+
+def rss_mb():
+    """Current resident set size (Linux), else the peak so far"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def measure_backend(backend, path, queries, k, n_probe):
+    """Runs in a child process: open the store, run the queries, report timings and RSS"""
+    import langchain_chroma  # noqa: F401  imported up front so both backends start from the same baseline
+    from vectorstore.mmap_index import MmapVectorStore
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        store = Chroma(persist_directory=path)
+    else:
+        store = MmapVectorStore(path, embedding=None, n_probe=n_probe)
+    open_seconds = time.perf_counter() - start
+
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([doc.id for doc in docs])
+    return {
+        "open_s": open_seconds,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "rss_delta_mb": rss_mb() - baseline,
+    }, results
+
+
+def build_collection(path, vectors, batch_size=5000):
+    from langchain_chroma import Chroma
+    # Cosine space, like the retriever's normalized embeddings
+    collection = Chroma(persist_directory=path, collection_metadata={"hnsw:space": "cosine"})._collection
+    for start in range(0, len(vectors), batch_size):
+        stop = min(len(vectors), start + batch_size)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, stop)],
+            embeddings=vectors[start:stop],
+            documents=[f"def function_{i}(x):\n    return x + {i}" for i in range(start, stop)],
+            metadatas=[{"name": f"function_{i}", "corpus": "bench"} for i in range(start, stop)],
+        )
+    return collection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--ivf-lists", type=int, default=256)
+    parser.add_argument("--ivf-probe", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Clustered like real code embeddings: unit vectors scattered around random topic centres
+    centres = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    noise = rng.standard_normal((args.rows, args.dim), dtype=np.float32) / np.sqrt(args.dim)
+    vectors = centres[rng.integers(args.clusters, size=args.rows)] + noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries near stored vectors, so each has a meaningful nearest neighbour
+    queries = vectors[rng.choice(args.rows, args.queries)] + 0.5 * rng.standard_normal((args.queries, args.dim)) / np.sqrt(args.dim)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    exact = [set(f"chunk-{i}" for i in np.argsort(-(vectors @ q))[:args.k]) for q in queries]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from vectorstore.mmap_index import export_from_chroma
+        chroma_path = os.path.join(tmp, "chroma")
+        start = time.perf_counter()
+        collection = build_collection(chroma_path, vectors)
+        print(f"Built Chroma collection with {args.rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        backends = {"chroma": chroma_path}
+        for name, dtype, lists in [("mmap-float16", "float16", 0), ("mmap-int8", "int8", 0),
+                                   ("mmap-float16-ivf", "float16", args.ivf_lists)]:
+            backends[name] = os.path.join(tmp, name)
+            export_from_chroma(collection, backends[name], dtype=dtype, ivf_lists=lists)
+        del collection
+
+        report = {"rows": args.rows, "dim": args.dim, "queries": args.queries, "k": args.k, "backends": {}}
+        for name, path in backends.items():
+            size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                stats, results = pool.submit(measure_backend, "chroma" if name == "chroma" else "mmap",
+                                             path, queries, args.k, args.ivf_probe).result()
+            recall = sum(len(exact[i] & set(ids)) for i, ids in enumerate(results)) / (args.k * args.queries)
+            report["backends"][name] = {**stats, "recall_at_k": recall, "disk_mb": size / 1024 ** 2}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Regression table for follow-up detection (agents/history.py).
+
+    python -m benchmarks.eval_follow_up
+
+A question taken for a follow-up reuses the previous turn's retrieval context,
+skips speculation, the explain fast path and the semantic cache, so a new
+question must never be mistaken for one. Prints every case that disagrees with
+the table and exits non-zero if there is any.
+"""
+import sys
+
+CASES = [
+    # New questions that merely use a pronoun
+    ("How do I read a csv file and sum its columns?", False),
+    ("Is it possible to sort a dict by value in python?", False),
+    ("What does yield do and when should I use it?", False),
+    ("def f(x):\n    return x * 2\nwhat does it return?", False),
+    ("```python\nprint(sorted(d))\n```\nwhy does it fail?", False),
+    ("Ok, write a binary search", False),
+    ("Now write a function that reverses a string", False),
+    ("write a function that returns its argument", False),
+    ("explain this code: def add(a, b): return a + b", False),
+    ("what is a decorator and how do I use one?", False),
+    # Follow-ups: an edit or redo of the previous answer
+    ("now make it recursive", True),
+    ("explain it again more simply", True),
+    ("can you fix it?", True),
+    ("please rewrite it to use a loop", True),
+    ("make it faster", True),
+    ("do the same for lists", True),
+    ("what about negative numbers?", True),
+    ("instead use a dictionary", True),
+    ("and also handle empty lists in your function", True),
+    ("rewrite the above in one line", True),
+]
+
+
+def main():
+    from agents.history import looks_like_follow_up
+    wrong = [(question, expected) for question, expected in CASES if looks_like_follow_up(question) != expected]
+    for question, expected in wrong:
+        print(f"expected {'follow-up' if expected else 'new question'}: {question!r}")
+    print(f"{len(CASES) - len(wrong)}/{len(CASES)} cases agree")
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Retrieval quality and latency of dense search, always-rerank and adaptive rerank.
+
+    python -m benchmarks.eval_rerank --candidates 20 --margin 0 0.02 0.05 0.1 0.2
+
+Runs the held-out queries in benchmarks/rerank_queries.jsonl (paraphrases that avoid
+the function names) against the real vectorstore and cross-encoder. A result is
+relevant when its chunk belongs to the query's HumanEval task. Dense search runs
+once per query with the result cache off; the cross-encoder scores every candidate
+set once, and the adaptive strategy only pays for it when the dense margin is
+below ``--margin``. Prints hit@1, hit@k, MRR@k, p50/p95 latency and the rerank rate,
+the adaptive ones for each margin given, and suggests the margin that reranks least
+while staying within MRR_TOLERANCE of always reranking (RERANK_SKIP_MARGIN).
+"""
+import argparse
+import json
+import os
+import time
+from benchmarks.load_test import percentile
+
+QUERIES = os.path.join(os.path.dirname(__file__), "rerank_queries.jsonl")
+MRR_TOLERANCE = 0.01
+
+
+def load_queries(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(ranks, latencies, k, reranked=None):
+    """ranks holds the 1-based rank of the first relevant result, or None past k"""
+    n = len(ranks)
+    summary = {
+        "hit@1": sum(rank == 1 for rank in ranks) / n,
+        f"hit@{k}": sum(rank is not None for rank in ranks) / n,
+        f"mrr@{k}": sum(1 / rank for rank in ranks if rank) / n,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+    }
+    if reranked is not None:
+        summary["rerank_rate"] = reranked / n
+    return summary
+
+
+def first_relevant(docs, task, k):
+    for rank, doc in enumerate(docs[:k], 1):
+        if doc.metadata.get("id") == task:
+            return rank
+    return None
+
+
+def suggest_margin(report, k):
+    """Margin with the lowest rerank rate whose MRR is within MRR_TOLERANCE of always reranking"""
+    target = report["rerank"][f"mrr@{k}"] - MRR_TOLERANCE
+    good = [(summary["rerank_rate"], float(margin)) for margin, summary in report["adaptive"].items()
+            if summary[f"mrr@{k}"] >= target]
+    return min(good)[1] if good else None
+
+
+def evaluate(queries, candidates, k, margins):
+    from vectorstore import retriever
+    from vectorstore.reranker import Reranker
+    # Every query must pay for a real search
+    retriever.RETRIEVAL_CACHE_SIZE = 0
+    reranker = Reranker()
+    # Load the model before timing anything
+    reranker.score("warm up", ["def f():\n    pass"])
+    retriever.dense_search_with_scores("warm up", candidates)
+
+    results = {name: {"ranks": [], "latencies": []} for name in ("dense", "rerank")}
+    adaptive = {margin: {"ranks": [], "latencies": [], "reranked": 0} for margin in margins}
+    for item in queries:
+        start = time.perf_counter()
+        hits = retriever.dense_search_with_scores(item["query"], candidates)
+        dense_seconds = time.perf_counter() - start
+        docs, dense_scores = [doc for doc, _ in hits], [score for _, score in hits]
+
+        start = time.perf_counter()
+        scores = reranker.score(item["query"], [doc.page_content for doc in docs])
+        rerank_seconds = time.perf_counter() - start
+        by_score = [docs[i] for i in sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)]
+
+        dense_rank, rerank_rank = first_relevant(docs, item["task"], k), first_relevant(by_score, item["task"], k)
+        results["dense"]["ranks"].append(dense_rank)
+        results["dense"]["latencies"].append(dense_seconds)
+        results["rerank"]["ranks"].append(rerank_rank)
+        results["rerank"]["latencies"].append(dense_seconds + rerank_seconds)
+        # The scores are the same for every margin; only the decision to use them changes
+        for margin, result in adaptive.items():
+            reranker.skip_margin = margin
+            rerank = reranker.should_rerank(dense_scores)
+            result["reranked"] += rerank
+            result["ranks"].append(rerank_rank if rerank else dense_rank)
+            result["latencies"].append(dense_seconds + rerank_seconds * rerank)
+
+    report = {
+        "queries": len(queries),
+        "candidates": candidates,
+        "k": k,
+        "dense": summarize(results["dense"]["ranks"], results["dense"]["latencies"], k),
+        "rerank": summarize(results["rerank"]["ranks"], results["rerank"]["latencies"], k, len(queries)),
+        "adaptive": {
+            str(margin): summarize(result["ranks"], result["latencies"], k, result["reranked"])
+            for margin, result in adaptive.items()
+        },
+    }
+    report["suggested_margin"] = suggest_margin(report, k)
+    return report
+
+
+def main():
+    from config.settings import RERANK_CANDIDATES, RERANK_SKIP_MARGIN
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=QUERIES, help="JSONL of {query, task}")
+    parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--margin", type=float, nargs="+", default=[RERANK_SKIP_MARGIN],
+                        help="one or more skip margins to evaluate the adaptive strategy at")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = evaluate(load_queries(args.queries), args.candidates, args.k, args.margin)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
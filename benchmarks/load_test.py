@@ -0,0 +1,109 @@
+"""Concurrent load test of the async graph against a local stub Ollama server.
+
+    python -m benchmarks.load_test --users 1 8 32 --requests-per-user 4
+
+Reports p50/p95 latency and throughput for each concurrency level, and how the
+requests were spread when ``--endpoints`` starts several stub servers. Retrieval
+still runs against the real vectorstore unless ``--no-retrieval`` is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from benchmarks.stub_ollama import start_stub_server
+
+QUESTIONS = [
+    "write a function that reverses a string",
+    "explain this code: def add(a, b):\n    return a + b",
+    "give me a function that checks if a number is prime",
+    "what does this do?\nfor i in range(3):\n    print(i)",
+    "can you help me?",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(app, users, requests_per_user):
+    from langchain_core.messages import HumanMessage
+
+    latencies = []
+
+    async def user(user_id):
+        for i in range(requests_per_user):
+            question = QUESTIONS[(user_id + i) % len(QUESTIONS)]
+            start = time.perf_counter()
+            await app.ainvoke({"message": [HumanMessage(content=question)]})
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(users)))
+    elapsed = time.perf_counter() - start
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "throughput_rps": len(latencies) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-user", type=int, default=4)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--endpoints", type=int, default=1, help="Stub servers to balance over")
+    parser.add_argument("--no-retrieval", action="store_true", help="Replace retrieval with a fixed context")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    servers, urls = zip(*(start_stub_server(token_latency=args.token_latency,
+                                            first_token_latency=args.first_token_latency)
+                          for _ in range(args.endpoints)))
+    # Must be set before config.settings is imported by the graph
+    os.environ["OLLAMA_ENDPOINTS"] = ",".join(urls)
+
+    from graph.conditional_graph import get_app
+    if args.no_retrieval:
+        from langchain_core.tools import tool
+        import agents.nodes
+
+        @tool
+        def retriever(query: str) -> str:
+            """Fixed context used instead of the vectorstore."""
+            return "Document 1:\ndef example():\n    return None"
+
+        agents.nodes.retriever = retriever
+
+    app = get_app()
+
+    async def run_all():
+        # One event loop for every level: the pooled async Ollama client is bound to it
+        return [await run_level(app, users, args.requests_per_user) for users in args.users]
+
+    results = asyncio.run(run_all())
+    for server in servers:
+        server.shutdown()
+    from utils.llm_pool import get_pool
+    endpoints = get_pool().stats()
+
+    if args.json:
+        print(json.dumps({"levels": results, "endpoints": endpoints}, indent=2))
+        return
+    print(f"{'users':>6} {'requests':>9} {'p50 (s)':>9} {'p95 (s)':>9} {'req/s':>8}")
+    for r in results:
+        print(f"{r['users']:>6} {r['requests']:>9} {r['p50_s']:>9.3f} {r['p95_s']:>9.3f} {r['throughput_rps']:>8.2f}")
+    for endpoint in endpoints:
+        print(f"{endpoint['url']}: {endpoint['served']} calls, {endpoint['failures']} failures")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""An in-process, deterministic stand-in for the Ollama LLM.
+
+Unlike ``stub_ollama`` no HTTP server is involved, so benchmarks measure the graph
+itself. Replies are chosen by ``stub_reply`` and paced by ``first_token_latency``
+and ``tokens_per_second``.
+
+    import agents.nodes
+    agents.nodes.llm = StubLLM(tokens_per_second=50)
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from benchmarks.stub_ollama import apply_stop, stub_reply, tokenize
+
+
+class StubLLM(LLM):
+    first_token_latency: float = 0.05
+    tokens_per_second: float = 50.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _tokens(self, prompt, stop=None):
+        return tokenize(apply_stop(stub_reply(prompt), stop))
+
+    def _delay(self, index):
+        # The first token arrives after first_token_latency, the rest at the token rate
+        return self.first_token_latency if index == 0 else 1 / self.tokens_per_second
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        tokens = self._tokens(prompt, stop)
+        time.sleep(sum(self._delay(i) for i in range(len(tokens))))
+        return "".join(tokens)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        tokens = self._tokens(prompt, stop)
+        await asyncio.sleep(sum(self._delay(i) for i in range(len(tokens))))
+        return "".join(tokens)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for i, token in enumerate(self._tokens(prompt, stop)):
+            time.sleep(self._delay(i))
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        for i, token in enumerate(self._tokens(prompt, stop)):
+            await asyncio.sleep(self._delay(i))
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
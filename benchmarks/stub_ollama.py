@@ -0,0 +1,176 @@
+"""A tiny stand-in for the Ollama HTTP API, for load tests and benchmarks.
+
+Implements just enough of ``/api/generate`` (streaming and non-streaming) and
+``/api/tags`` for the langchain/ollama clients. Replies are deterministic and
+token delivery is paced by ``token_latency`` seconds per token.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Like a code model's answers, it does not stop at the function: an explanation, a
+# usage example and the function again follow (what early stopping is measured on)
+CODE_REPLY = (
+    "Here is a function that does that:\n"
+    "\n"
+    "```python\n"
+    "def solution(values):\n"
+    "    \"\"\"Return the processed values.\"\"\"\n"
+    "    return [value for value in values if value is not None]\n"
+    "```\n"
+    "\n"
+    "This function walks the list once and keeps every value that is not None.\n"
+    "\n"
+    "Example usage:\n"
+    "\n"
+    "```python\n"
+    "print(solution([1, None, 2]))  # [1, 2]\n"
+    "```\n"
+    "\n"
+    "The comprehension builds a new list, so the input is left unchanged. If you prefer\n"
+    "a loop, here is the same function written out step by step:\n"
+    "\n"
+    "```python\n"
+    "def solution(values):\n"
+    "    result = []\n"
+    "    for value in values:\n"
+    "        if value is not None:\n"
+    "            result.append(value)\n"
+    "    return result\n"
+    "```\n"
+)
+TEXT_REPLY = "This code walks through the input once and returns the matching items."
+
+
+def classify_reply(user_input: str) -> str:
+    user_input = user_input.lower()
+    if "explain" in user_input or "what does" in user_input:
+        return "explain"
+    return "generate" if "write" in user_input or "function" in user_input else "unclear"
+
+
+def stub_reply(prompt: str) -> str:
+    """Pick a deterministic reply based on which of our prompts was sent"""
+    if "Respond with one line per input" in prompt:
+        inputs = re.findall(r"Input \d+:\n(.*?)(?=\n\nInput \d+:|\n\nRespond with one line)", prompt, re.DOTALL)
+        return "\n".join(f"{i}: {classify_reply(text)}" for i, text in enumerate(inputs, 1))
+    if "Respond with only one word" in prompt:
+        # Look at the user's text only; the prompt's own examples mention every label
+        return classify_reply(prompt.rsplit("User input:", 1)[-1].split("Respond with only one word")[0])
+    if "expert code generator" in prompt:
+        return CODE_REPLY
+    return TEXT_REPLY
+
+
+def apply_stop(text: str, stop=None) -> str:
+    """Cut ``text`` at the first stop sequence, as Ollama does"""
+    cuts = [text.find(sequence) for sequence in stop or () if sequence in text]
+    return text[:min(cuts)] if cuts else text
+
+
+def tokenize(text: str):
+    # Roughly one token per word, keeping whitespace so the stream reassembles exactly
+    tokens, current = [], ""
+    for char in text:
+        current += char
+        if char in " \n":
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    token_latency = 0.01
+    first_token_latency = 0.05
+    models = ("stub:latest",)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path in ("/api/tags", "/"):
+            self._send_json({"models": [{"name": name, "model": name} for name in self.models]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        options = request.get("options") or {}
+        tokens = tokenize(apply_stop(stub_reply(request.get("prompt", "")), options.get("stop")))
+        num_predict = options.get("num_predict")
+        if num_predict and num_predict > 0:
+            tokens = tokens[:num_predict]
+        model = request.get("model", "stub")
+        time.sleep(self.first_token_latency)
+
+        if not request.get("stream", True):
+            time.sleep(self.token_latency * len(tokens))
+            self._send_json({"model": model, "response": "".join(tokens), "done": True,
+                             "done_reason": "stop", "eval_count": len(tokens)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunks = [{"model": model, "response": token, "done": False} for token in tokens]
+        chunks.append({"model": model, "response": "", "done": True,
+                       "done_reason": "stop", "eval_count": len(tokens)})
+        try:
+            for chunk in chunks:
+                line = (json.dumps(chunk) + "\n").encode()
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+                if not chunk["done"]:
+                    time.sleep(self.token_latency)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. early stopping); so does Ollama
+            self.close_connection = True
+
+
+def start_stub_server(port=0, token_latency=0.01, first_token_latency=0.05, models=None):
+    """Start the stub in a daemon thread; returns (server, base_url). ``models`` is what /api/tags lists"""
+    handler = type("Handler", (StubOllamaHandler,), {
+        "token_latency": token_latency,
+        "first_token_latency": first_token_latency,
+        "models": tuple(models or StubOllamaHandler.models),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--models", nargs="+", help="Model names listed by /api/tags")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.token_latency, args.first_token_latency, args.models)
+    print(f"Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -3,8 +3,136 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-PERSIST_DIR = "./chroma_code_db"
+PERSIST_DIR = os.getenv("PERSIST_DIR", "./chroma_code_db")
 os.makedirs(PERSIST_DIR, exist_ok=True)
 
 EMBEDDING_MODEL_NAME = "intfloat/e5-base-v2"
 OLLAMA_MODEL_NAME = "codellama:7b"
+
+# Intent classifier: rules always run first, the embedding tier is optional,
+# and the LLM is only called when neither is confident
+CLASSIFIER_EMBEDDING_TIER = False
+CLASSIFIER_EMBEDDING_THRESHOLD = 0.8
+
+# Stamp rewritten on every vectorstore build; caches compare against it
+VECTORSTORE_VERSION_FILE = os.path.join(PERSIST_DIR, "VERSION")
+
+# Semantic response cache in front of the graph
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.95        # minimum cosine similarity for a hit
+SEMANTIC_CACHE_MAX_ENTRIES = 1000      # LRU bound
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 3600
+SEMANTIC_CACHE_PATH = "./semantic_cache.sqlite3"  # None keeps the cache in memory only
+
+# Ollama servers and the pooled HTTP clients used to reach them. OLLAMA_ENDPOINTS is a
+# comma-separated list; each call goes to the healthy one with the fewest requests in flight
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_ENDPOINTS = [url.strip() for url in os.getenv("OLLAMA_ENDPOINTS", OLLAMA_BASE_URL).split(",") if url.strip()]
+OLLAMA_MAX_CONNECTIONS = 32        # per endpoint
+OLLAMA_TIMEOUT_SECONDS = 120
+OLLAMA_HEALTH_CHECK_SECONDS = 10   # interval of the background /api/tags probe; 0 disables it
+
+# Model and Ollama options per graph node. A small quantized model for "chat" (e.g.
+# "qwen2.5-coder:1.5b") keeps classification from queueing behind 7B generations.
+# num_predict caps each node's answer in tokens.
+MODEL_REGISTRY = {
+    "chat": {"model": OLLAMA_MODEL_NAME, "temperature": 0.0, "num_predict": 128},
+    "generate_code": {"model": OLLAMA_MODEL_NAME, "temperature": 0.2, "num_ctx": 4096, "num_predict": 512},
+    "explain_code": {"model": OLLAMA_MODEL_NAME, "temperature": 0.2, "num_ctx": 4096, "num_predict": 768},
+    "fallback": {"model": OLLAMA_MODEL_NAME, "temperature": 0.2, "num_predict": 384},
+    "compact_history": {"model": OLLAMA_MODEL_NAME, "temperature": 0.0, "num_predict": 256},
+}
+
+# Stop sequences sent with each node's requests. They replace the model's own (the
+# codellama template's are kept here), so a node listed must repeat them.
+STOP_SEQUENCES = {
+    "generate_code": ["[INST]", "[/INST]", "<<SYS>>", "<</SYS>>", "\nif __name__", "\n# Example usage", "\n# Test"],
+}
+# Cut generated code once a complete function or class plus this many tokens of
+# explanation has streamed (utils/generation_control.py)
+GENERATION_EARLY_STOP = True
+GENERATION_EXPLANATION_TOKENS = 80
+
+# Explain fast path (agents/explain.py): code that parses is summarized with ast for a
+# shorter prompt, and a plain "explain this" about at most EXPLAIN_TEMPLATE_MAX_LINES
+# lines is answered from templates without the LLM (0 disables templates)
+EXPLAIN_TEMPLATE_MAX_LINES = 3
+EXPLAIN_CACHE_SIZE = 1024  # explanations keyed on the code's normalized AST; 0 disables
+
+# Gradio request handling
+GRADIO_CONCURRENCY_LIMIT = 8   # handlers running at once
+GRADIO_MAX_QUEUE_SIZE = 64     # requests waiting beyond that are rejected
+
+# Vectorstore indexing
+EMBED_BATCH_SIZE = 256  # chunks embedded and upserted per batch
+BUILD_CHECKPOINT_FILE = os.path.join(PERSIST_DIR, "build_checkpoint.json")
+INGEST_STATE_FILE = os.path.join(PERSIST_DIR, "ingest_state.json")  # last indexed commit per corpus
+INGEST_MAX_FILE_BYTES = 1_000_000  # larger files (generated, minified, data) are skipped
+EMBED_WORKERS = 1          # >1 embeds on a process pool, one model copy per worker
+EMBED_MAX_SEQ_LENGTH = 512 # tokens per chunk seen by the embedding model
+
+# Code chunking
+CHUNK_MAX_LINES = 80      # longer functions are cut into sliding windows
+CHUNK_OVERLAP_LINES = 10  # lines shared by consecutive windows
+
+# Dense search backend: "chroma", or "mmap" for a memory-mapped snapshot exported from Chroma
+VECTOR_BACKEND = "chroma"
+MMAP_INDEX_DIR = os.getenv("MMAP_INDEX_DIR", "./mmap_index")
+MMAP_INDEX_DTYPE = "float16"  # or "int8" (per-row scaled), a quarter of the float32 size
+MMAP_IVF_LISTS = 0            # >0 partitions rows into this many k-means lists (for large corpora)
+MMAP_IVF_PROBE = 8            # lists searched per query when partitioned
+
+# Retrieval: "hybrid" fuses BM25 and dense results, "dense" is similarity search only
+RETRIEVER_MODE = "hybrid"
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "./bm25_index.json")
+HYBRID_CANDIDATES = 20         # results taken from each ranker before fusion
+HYBRID_RRF_K = 60              # reciprocal rank fusion constant
+LEXICAL_DECISIVE_RATIO = 2.0   # top BM25 score must beat the runner-up by this factor to skip dense search
+
+# Cross-encoder reranking: RERANK_CANDIDATES dense results are rescored and the best k kept.
+# Skipped when the top dense hit leads the runner-up by RERANK_SKIP_MARGIN or more
+# (in the backend's relevance score units). 0.05 is a starting point, not a measured value:
+# set it to the suggested_margin of benchmarks/eval_rerank.py before turning reranking on
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20
+RERANK_SKIP_MARGIN = 0.05
+RERANK_BATCH_SIZE = 32
+RERANK_MAX_LENGTH = 512  # tokens of query plus snippet seen by the cross-encoder
+
+# Retriever caches: query text -> embedding, and (query embedding, k) -> (document id, score).
+# Sizes are entry counts (0 disables); cached results are dropped when the version stamp changes
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_SIZE = 4096
+
+# Prompt context assembly
+CONTEXT_TOKEN_BUDGET = 1500                             # tokens of retrieved code per prompt
+CONTEXT_TOKENIZER_NAME = "codellama/CodeLlama-7b-hf"    # tokenizer matching OLLAMA_MODEL_NAME
+CONTEXT_SNIPPET_MAX_LINES = 30                          # longer snippets are trimmed to their most relevant lines
+CONTEXT_DEDUP_THRESHOLD = 0.8                           # shingle Jaccard similarity treated as a duplicate
+
+# Instrumentation: spans are appended to TRACE_FILE as JSON lines when it is set
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+# Micro-batching: concurrent query embeddings and LLM classifications are merged into one call
+BATCHING_ENABLED = True
+BATCH_MAX_WAIT_MS = 10   # extra latency the first request of a batch may wait for others
+BATCH_MAX_SIZE = 16
+CLASSIFY_BATCH_WORKERS = 4  # classification batches (LLM calls) in flight at once
+
+# Conversation sessions: one LangGraph thread per username, checkpointed to SQLite
+SESSION_DB_PATH = "./sessions.sqlite3"
+SESSION_HISTORY_TOKEN_BUDGET = 1000  # older (question, answer) turns are folded into a summary
+SESSION_SUMMARIZE = False            # summarize dropped turns with the LLM instead of listing the questions
+SESSION_SUMMARY_MAX_CHARS = 1000
+
+# Speculative routing: while the LLM tier classifies, start the likely route's work early.
+# Per route: None, "retrieval" (generate only: fetch the context) or "generation" (also
+# stream the answer into a buffer). Work for routes the router does not pick is cancelled.
+SPECULATION_ROUTES = {"generate": "retrieval", "explain": None, "unclear": None}
+
+# Batch jobs (batch/runner.py): questions run through the graph at once. Ollama answers
+# OLLAMA_NUM_PARALLEL requests per model at a time (4 by default) and queues the rest,
+# so about that many per endpoint keeps every server busy without piling up a queue
+BATCH_JOB_CONCURRENCY = 4 * len(OLLAMA_ENDPOINTS)
+BATCH_JOB_TIMEOUT_SECONDS = 600  # per question; a timed-out item is recorded and retried on resume
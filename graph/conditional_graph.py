@@ -1,13 +1,30 @@
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from agents.state import StateAgent
-from agents.nodes import chat, generate_code, explain_code, fallback, router
+from utils.metrics import traced_node
+from agents.nodes import (
+    chat, achat,
+    generate_code, agenerate_code,
+    explain_code, aexplain_code,
+    fallback, afallback,
+    compact_history, acompact_history,
+    router
+)
 
-def get_app():
+def node(name, func, afunc):
+    return RunnableLambda(traced_node(name, func), afunc=traced_node(name, afunc))
+
+def get_app(checkpointer=None):
+    # Each node carries a sync and an async implementation, so the compiled graph
+    # serves both invoke/stream and ainvoke/astream; both are timed per request.
+    # With a checkpointer the state persists per thread_id (one conversation per user);
+    # without one every invocation starts from an empty state.
     graph = StateGraph(StateAgent)
-    graph.add_node('chat', chat)
-    graph.add_node('generate_code', generate_code)
-    graph.add_node('explain_code', explain_code)
-    graph.add_node('fallback', fallback)
+    graph.add_node('chat', node('chat', chat, achat))
+    graph.add_node('generate_code', node('generate_code', generate_code, agenerate_code))
+    graph.add_node('explain_code', node('explain_code', explain_code, aexplain_code))
+    graph.add_node('fallback', node('fallback', fallback, afallback))
+    graph.add_node('compact_history', node('compact_history', compact_history, acompact_history))
     
     graph.set_entry_point('chat')
     graph.add_conditional_edges('chat', router, {
@@ -15,8 +32,9 @@ def get_app():
         'explain': 'explain_code',
         'unclear': 'fallback'
     })
-    graph.add_edge('generate_code', END)
-    graph.add_edge('explain_code', END)
-    graph.add_edge('fallback', END)
+    graph.add_edge('generate_code', 'compact_history')
+    graph.add_edge('explain_code', 'compact_history')
+    graph.add_edge('fallback', 'compact_history')
+    graph.add_edge('compact_history', END)
     
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
@@ -42,10 +42,48 @@ User input:
 Respond with only one word: generate, explain, or unclear.
 """
 
+# Several inputs in one LLM call (micro-batching under concurrent load)
+def classify_batch_prompt(user_inputs) -> str:
+    numbered = "\n\n".join(f"Input {i}:\n{text}" for i, text in enumerate(user_inputs, 1))
+    return f"""You are an expert coding assistant.
+
+Classify each of the following user inputs based on the user's intent. Choose one of the following categories:
+
+- generate → if they are asking you to write or create code.
+- explain → if they are asking you to analyze, interpret, or describe existing code.
+- unclear → if the input is ambiguous or irrelevant to code generation or explanation.
+
+{numbered}
+
+Respond with one line per input in the form "<number>: <category>", for example "1: generate".
+"""
+
+#------------------------------------Conversation History----------------------------------------------
+def history_section(history: str) -> str:
+    if not history:
+        return ""
+    return f"""
+Conversation so far (for context on follow-up requests):
+{history}
+"""
+
+def summarize_prompt(summary: str, conversation: str) -> str:
+    return f"""Summarize the following conversation between a user and a coding assistant in at most five sentences.
+Keep function names, requirements and decisions; drop pleasantries.
+
+Existing summary:
+{summary or "(none)"}
+
+New conversation:
+{conversation}
+
+Summary:
+"""
+
 #------------------------------------Explanation Prompt----------------------------------------------
-def explain_prompt(code: str) -> str:
+def explain_prompt(code: str, history: str = "") -> str:
     return f"""You are an expert programmer and technical writer.
-
+{history_section(history)}
 Your task is to explain the following Python code in simple terms so that a junior developer or student can understand it.
 
 Explain:
@@ -59,10 +97,21 @@ CODE:
 {code}
 """
 
+def explain_summary_prompt(code: str, summary: str, question: str = "", history: str = "") -> str:
+    ask = f"The user asks: {question}" if question else "Explain what it does and how, step by step."
+    return f"""{history_section(history)}Python code, with a static summary of it:
+{summary}
+
+CODE:
+{code}
+
+{ask} Keep it short and simple; do not restate the summary.
+"""
+
 #------------------------------------Generate Prompt----------------------------------------------
-def generate_prompt(user_input: str, context: str) -> str:
+def generate_prompt(user_input: str, context: str, history: str = "") -> str:
     return f"""You are an expert code generator.
-
+{history_section(history)}
 Below are relevant code snippets from previous solutions:
 {context}
 
@@ -92,9 +141,9 @@ Requirements:
 
 # Be honest, concise, and helpful.
 # """
-def fallback_prompt(user_input: str) -> str:
+def fallback_prompt(user_input: str, history: str = "") -> str:
     return f"""You are a concise and helpful AI programming assistant.
-
+{history_section(history)}
 Here is the user's message:
 \"\"\"{user_input}\"\"\"
 
@@ -1,17 +1,37 @@
+import threading
 from langchain_core.tools import tool
 from vectorstore.retriever import get_retriever
+from utils.context_packer import pack_context
+from utils import metrics
 
-retriever_tool = get_retriever()
+# Built on first use so importing the tools does not open the vectorstore
+_retriever_tool = None
+_retriever_lock = threading.Lock()
+
+def get_retriever_tool():
+    """Get the singleton retriever used by the retriever tool"""
+    global _retriever_tool
+    if _retriever_tool is None:
+        with _retriever_lock:
+            if _retriever_tool is None:
+                _retriever_tool = get_retriever()
+    return _retriever_tool
 
 @tool
 def retriever(query: str) -> str:
     """
     Searches the code vectorstore for examples similar to the query.
     """
-    docs = retriever_tool.invoke(query)
+    with metrics.stage("retriever") as span:
+        docs = get_retriever_tool().invoke(query)
+        span.attributes["documents"] = len(docs)
     if not docs:
         return "No relevant code examples found."
 
-    return "\n\n".join(f"Document {i+1}:\n{doc.page_content}" for i, doc in enumerate(docs))
+    # Deduplicated, trimmed and packed into CONTEXT_TOKEN_BUDGET tokens
+    with metrics.stage("context_packing") as span:
+        context, tokens = pack_context([doc.page_content for doc in docs], query)
+        span.attributes["context_tokens"] = tokens
+    return context
 
 tools = [retriever]
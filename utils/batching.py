@@ -0,0 +1,98 @@
+"""Micro-batching of concurrent calls into one batched call.
+
+Requests arriving within ``max_wait_ms`` of the first pending one (up to
+``max_batch_size`` of them) are handed to ``batch_fn`` together, and each caller
+gets its own result back. Works for threads (``submit``) and coroutines (``asubmit``).
+With ``workers`` > 1 up to that many batches run at once; the next batch is only
+collected once a worker is free, so requests keep merging while all of them are busy.
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from config.settings import BATCH_MAX_WAIT_MS, BATCH_MAX_SIZE
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn, max_wait_ms=BATCH_MAX_WAIT_MS, max_batch_size=BATCH_MAX_SIZE, name="batcher",
+                 workers=1):
+        self.batch_fn = batch_fn  # list of items -> list of results, same order
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._workers = ThreadPoolExecutor(workers, thread_name_prefix=name) if workers > 1 else None
+        self._free = threading.Semaphore(workers)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit_future(self, item) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit(self, item):
+        """Block until the batch containing ``item`` has run; return its result"""
+        return self.submit_future(item).result()
+
+    async def asubmit(self, item):
+        return await asyncio.wrap_future(self.submit_future(item))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._free.acquire()
+            batch = self._collect()
+            if self._workers is None:
+                self._dispatch(batch)
+            else:
+                self._workers.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise ValueError(f"{self.name}: got {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._free.release()
+        with self._lock:
+            self._batches += 1
+            self._items += len(items)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+            }
@@ -1,13 +1,145 @@
+import ast
 import re
+import textwrap
 from langchain_core.documents import Document
+from config.settings import CHUNK_MAX_LINES, CHUNK_OVERLAP_LINES
+
+DEF_PATTERN = re.compile(r"^(?:@.*\n)*(?:async\s+)?(?:def|class)\s+\w+", re.MULTILINE)
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
 
 def split_code_by_function(doc: Document):
+    return list(iter_code_chunks(doc))
+
+def iter_code_chunks(doc: Document, max_lines=CHUNK_MAX_LINES, overlap=CHUNK_OVERLAP_LINES):
+    """Yield one chunk per top-level function, class and method.
+
+    Module-level code other than imports is kept as its own chunks. Every chunk
+    carries its qualified name, kind, 1-based line range and the module's imports
+    as metadata. Chunks longer than ``max_lines`` are cut into overlapping windows,
+    and sources that do not parse fall back to a regex split. Documents whose
+    "language" metadata is not Python are only cut into windows.
+    """
+    text = doc.page_content
+    if not text.strip():
+        return
+    if doc.metadata.get("language", "python") != "python":
+        yield from _cap([doc], max_lines, overlap)
+        return
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        yield from _cap(split_code_by_regex(doc), max_lines, overlap)
+        return
+
+    lines = text.splitlines(keepends=True)
+    imports = ", ".join(_imported_names(tree))
+    base = {**doc.metadata, "imports": imports}
+
+    def make(start, end, name, kind):
+        content = textwrap.dedent("".join(lines[start - 1:end])).strip()
+        if not content:
+            return []
+        chunk = Document(
+            page_content=content,
+            metadata={**base, "name": name, "kind": kind, "start_line": start, "end_line": end}
+        )
+        return _cap([chunk], max_lines, overlap)
+
+    module_start = None
+    module_end = None
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if module_start is not None:
+                yield from make(module_start, module_end, "<module>", "module")
+                module_start = None
+            start = _start_line(node, lines)
+            if isinstance(node, ast.ClassDef):
+                yield from _class_chunks(node, start, make, lines)
+            else:
+                yield from make(start, node.end_lineno, node.name, "function")
+        elif not isinstance(node, (ast.Import, ast.ImportFrom)):
+            if module_start is None:
+                module_start = node.lineno
+            module_end = node.end_lineno
+    if module_start is not None:
+        yield from make(module_start, module_end, "<module>", "module")
+
+def _class_chunks(node, start, make, lines, prefix=""):
+    name = prefix + node.name
+    members = [i for i, n in enumerate(node.body) if isinstance(n, DEFINITIONS)]
+    if not members:
+        yield from make(start, node.end_lineno, name, "class")
+        return
+    # The class chunk keeps the header, docstring and attributes up to the first method;
+    # attributes further down get chunks of their own and nested classes are split the same way
+    yield from make(start, _start_line(node.body[members[0]], lines) - 1, name, "class")
+    run_start = run_end = None
+    for member in node.body[members[0]:]:
+        if not isinstance(member, DEFINITIONS):
+            run_start = run_start or _start_line(member, lines)
+            run_end = member.end_lineno
+            continue
+        if run_start is not None:
+            yield from make(run_start, run_end, name, "class")
+            run_start = None
+        member_start = _start_line(member, lines)
+        if isinstance(member, ast.ClassDef):
+            yield from _class_chunks(member, member_start, make, lines, f"{name}.")
+        else:
+            yield from make(member_start, member.end_lineno, f"{name}.{member.name}", "method")
+    if run_start is not None:
+        yield from make(run_start, run_end, name, "class")
+
+def _start_line(node, lines):
+    """First line of a definition, including decorators and comments directly above it"""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    while start > 1 and lines[start - 2].lstrip().startswith("#"):
+        start -= 1
+    return start
+
+def _imported_names(tree):
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names.append(node.module or ".")
+    return list(dict.fromkeys(names))
+
+def _cap(chunks, max_lines, overlap):
+    """Cut chunks longer than max_lines into overlapping line windows"""
+    step = max(1, max_lines - overlap)
+    for chunk in chunks:
+        chunk_lines = chunk.page_content.splitlines()
+        if len(chunk_lines) <= max_lines:
+            yield chunk
+            continue
+        first_line = chunk.metadata.get("start_line", 1)
+        for part, offset in enumerate(range(0, len(chunk_lines) - overlap, step)):
+            window = chunk_lines[offset:offset + max_lines]
+            yield Document(
+                page_content="\n".join(window),
+                metadata={
+                    **chunk.metadata,
+                    "part": part,
+                    "start_line": first_line + offset,
+                    "end_line": first_line + offset + len(window) - 1,
+                }
+            )
+
+def split_code_by_regex(doc: Document):
+    """Regex split at top-level def/class lines, for sources that do not parse"""
     text = doc.page_content
-    matches = list(re.finditer(r"^def\s+\w+\(.*?\):", text, re.MULTILINE))
+    matches = list(DEF_PATTERN.finditer(text))
     if not matches:
         return [doc]
     starts = [m.start() for m in matches] + [len(text)]
+    if starts[0] > 0 and text[:starts[0]].strip():
+        starts.insert(0, 0)
     return [
-        Document(page_content=text[starts[i]:starts[i+1]].strip(), metadata=doc.metadata)
+        Document(
+            page_content=text[starts[i]:starts[i+1]].strip(),
+            metadata={**doc.metadata, "start_line": text.count("\n", 0, starts[i]) + 1}
+        )
         for i in range(len(starts) - 1)
     ]
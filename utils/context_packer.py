@@ -0,0 +1,89 @@
+import hashlib
+import re
+import threading
+from config.settings import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOKENIZER_NAME,
+    CONTEXT_SNIPPET_MAX_LINES,
+    CONTEXT_DEDUP_THRESHOLD,
+)
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def get_tokenizer():
+    """Get the generation model's tokenizer, or None if it cannot be loaded"""
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(CONTEXT_TOKENIZER_NAME)
+            except Exception as e:
+                print(f"Tokenizer {CONTEXT_TOKENIZER_NAME} unavailable, estimating tokens from length: {e}")
+                _tokenizer = False
+    return _tokenizer or None
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # Code averages roughly 3-4 characters per Llama token
+        return len(text) // 3 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def _shingles(text, size=5):
+    tokens = re.findall(r"\w+|[^\w\s]", text)
+    return {tuple(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))}
+
+def dedupe(snippets, threshold=CONTEXT_DEDUP_THRESHOLD):
+    """Drop exact and near-duplicate snippets, keeping the earlier (better ranked) one"""
+    kept, kept_shingles, hashes = [], [], set()
+    for snippet in snippets:
+        digest = hashlib.sha1(re.sub(r"\s+", " ", snippet).strip().encode()).hexdigest()
+        if digest in hashes:
+            continue
+        shingles = _shingles(snippet)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles):
+            continue
+        hashes.add(digest)
+        kept.append(snippet)
+        kept_shingles.append(shingles)
+    return kept
+
+def trim_snippet(snippet, query, max_lines=CONTEXT_SNIPPET_MAX_LINES):
+    """Keep the first line (usually the signature) plus the window most relevant to the query"""
+    lines = snippet.splitlines()
+    if len(lines) <= max_lines:
+        return snippet
+    from vectorstore.lexical import tokenize_code
+    query_tokens = set(tokenize_code(query))
+    scores = [len(query_tokens.intersection(tokenize_code(line))) for line in lines]
+    window = max_lines - 1
+    best_start, best_score = 1, -1
+    running = sum(scores[1:1 + window])
+    for start in range(1, len(lines) - window + 1):
+        if start > 1:
+            running += scores[start + window - 1] - scores[start - 1]
+        if running > best_score:
+            best_start, best_score = start, running
+    kept = lines[best_start:best_start + window]
+    head = [lines[0]] + (["    ..."] if best_start > 1 else [])
+    tail = ["    ..."] if best_start + window < len(lines) else []
+    return "\n".join(head + kept + tail)
+
+def pack_context(snippets, query, budget=CONTEXT_TOKEN_BUDGET):
+    """Assemble ranked snippets into a context string that fits the token budget.
+
+    Snippets are deduplicated, trimmed to their most relevant lines and added
+    greedily in rank order; one that does not fit is skipped in favour of smaller
+    ones further down. Returns (context, token_count).
+    """
+    parts, used = [], 0
+    for snippet in dedupe(snippets):
+        part = f"Document {len(parts) + 1}:\n{trim_snippet(snippet.strip(), query)}"
+        tokens = count_tokens(part)
+        if used + tokens > budget:
+            continue
+        parts.append(part)
+        used += tokens
+    return "\n\n".join(parts), used
@@ -0,0 +1,270 @@
+"""Early stopping for streamed code generation.
+
+Code models rarely stop at the end of the function they were asked for: they go on
+to explain it at length, add usage examples, or write the function again.
+``CodeStopper`` watches the stream line by line. Top-level lines are told apart from
+prose with ``codeop``, and once the code seen so far parses (``ast``) into a complete
+function or class, the answer may run on for GENERATION_EXPLANATION_TOKENS of
+explanation. It is cut at the end of that sentence, or when another code block
+turns out to define nothing new: the same function again, or a usage example that
+ends without a definition. A block that defines a new function (a helper, then the
+main function, or a constant and the function using it) carries on.
+"""
+import ast
+import asyncio
+import codeop
+import re
+import threading
+import warnings
+from utils import metrics
+from utils.context_packer import count_tokens
+from config.settings import GENERATION_EXPLANATION_TOKENS
+
+# Lines after the code that start another block
+REPEAT_PREFIXES = ("```", "def ", "async def ", "class ", "@")
+DEFINITION = re.compile(r"(?:async\s+)?(?:def|class)\s+(\w+)\s*[(:]")
+SENTENCE_END = re.compile(r"[.!?]\s*$")
+
+
+def is_python(line: str) -> bool:
+    """True if ``line`` can start a Python statement, False for prose"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            codeop.compile_command(line.strip(), symbol="exec")
+        return True
+    except (SyntaxError, ValueError, OverflowError):
+        return False
+
+
+def defined_names(source: str) -> set:
+    """Names of the functions and classes ``source`` defines at top level; empty if it does not parse"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    return {node.name for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+
+
+def defines_something(source: str) -> bool:
+    """True if ``source`` parses and defines a function or class at top level"""
+    return bool(defined_names(source))
+
+
+class CodeStopper:
+    """Decides, chunk by chunk, how much of a streamed answer to pass on.
+
+    ``feed(chunk)`` returns the text that can be released so far and sets ``stopped``
+    to the reason once the rest should be dropped; ``finish()`` returns what is left
+    when the stream ends.
+    """
+
+    def __init__(self, node, explanation_tokens=GENERATION_EXPLANATION_TOKENS):
+        self.node = node
+        self.explanation_tokens = explanation_tokens
+        self.text = ""
+        self.stopped = None
+        self._line_start = 0    # start of the line not yet complete
+        self._released = 0
+        self._cut = None        # length of the answer once stopped
+        self._in_fence = False
+        self._code_start = None
+        self._code_end = None   # where the explanation starts
+        self._defined = set()   # names the released code defines
+        self._block = None      # (cut position, fenced, code start) of a block after the code, undecided
+
+    def _stop(self, reason, at):
+        self.stopped, self._cut = reason, at
+
+    def _code_finished(self, at, source):
+        self._code_end = at
+        self._defined |= defined_names(source)
+        if not self.explanation_tokens:
+            self._stop("code", at)
+
+    def _line(self, start, end):
+        line = self.text[start:end]
+        if self._block is not None:
+            self._block_line(start, line)
+            return
+        if self._code_end is not None:
+            if line.startswith(REPEAT_PREFIXES):
+                fenced = line.startswith("```")
+                self._block = (self._intro_start(start), fenced, end if fenced else start)
+                if not fenced:
+                    self._block_line(start, line)
+            elif count_tokens(self.text[self._code_end:end]) > self.explanation_tokens:
+                self._stop("explanation", end)
+            return
+        if line.lstrip().startswith("```"):
+            if self._in_fence and defines_something(self.text[self._code_start:start]):
+                self._code_finished(end, self.text[self._code_start:start])
+            elif not self._in_fence:
+                self._code_start = end
+            self._in_fence = not self._in_fence
+            return
+        if self._in_fence or not line.strip() or line[0] in " \t":
+            return
+        # An unfenced answer: a top-level line of prose after the code ends it
+        if is_python(line):
+            if self._code_start is None:
+                self._code_start = start
+        elif self._code_start is not None and defines_something(self.text[self._code_start:start]):
+            self._code_finished(start, self.text[self._code_start:start])
+
+    def _block_line(self, start, line):
+        """Decide on a block after the code from its first top-level definition, or as an
+        example once it ends without one. Setup lines (constants, imports) may come first."""
+        cut, fenced, code_start = self._block
+        if fenced:
+            ended = line.lstrip().startswith("```")
+        else:
+            ended = bool(line.strip()) and line[0] not in " \t" and not is_python(line)
+        if ended:
+            self._stop("example", cut)
+            return
+        definition = DEFINITION.match(line)
+        if definition is None:
+            return
+        if definition.group(1) in self._defined:
+            self._stop("repeat", cut)
+        else:
+            # More code, e.g. the main function after a helper: it ends and gets its
+            # explanation budget the same way the first block did
+            self._block = None
+            self._code_end = None
+            self._in_fence = fenced
+            self._code_start = code_start
+
+    def _intro_start(self, end):
+        """Start of a trailing "Example usage:"-style line before ``end``, else ``end``"""
+        intro = self.text[self._code_end:end].rstrip()
+        if not intro.endswith(":"):
+            return end
+        return self._code_end + intro.rfind("\n") + 1
+
+    def _releasable(self):
+        """How far the text can be passed on. After the code, lines go out once complete,
+        and a line introducing more code is held back until the next one shows up."""
+        if self.stopped:
+            return self._cut
+        if self._block is not None:
+            return self._block[0]
+        if self._code_end is None:
+            return len(self.text)
+        return self._intro_start(self._line_start)
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped:
+            return ""
+        self.text += chunk
+        while not self.stopped and (newline := self.text.find("\n", self._line_start)) != -1:
+            self._line(self._line_start, newline + 1)
+            self._line_start = newline + 1
+        if (not self.stopped and self._code_end is not None and self._block is None and SENTENCE_END.search(self.text)
+                and count_tokens(self.text[self._code_end:]) > self.explanation_tokens):
+            self._stop("explanation", len(self.text))
+        end = max(self._released, self._releasable())
+        released, self._released = self.text[self._released:end], end
+        return released
+
+    def finish(self) -> str:
+        """The rest of the answer once the stream has ended, closing a cut-off code block"""
+        if self._block is not None and not self.stopped:
+            # The stream ended before the block showed what it is
+            self._stop("example", self._block[0])
+        rest = "" if self.stopped else self.text[self._released:]
+        self._released = len(self.text)
+        if self._in_fence:
+            rest += "```\n" if (self.text + rest).endswith("\n") else "\n```\n"
+        stats.record(self.node, self.stopped)
+        if self.stopped:
+            metrics.annotate(early_stop=self.stopped)
+        return rest
+
+
+def controlled(stream, stopper):
+    """Yield what ``stopper`` releases from a token stream, closing the stream once it stops"""
+    try:
+        for chunk in stream:
+            if text := stopper.feed(chunk):
+                yield text
+            if stopper.stopped:
+                break
+    finally:
+        stream.close()
+    if text := stopper.finish():
+        yield text
+
+
+async def acontrolled(stream, stopper):
+    """Async counterpart of controlled.
+
+    The stream is read by a task of its own and stopped by cancelling it: the
+    cancellation reaches the HTTP read at the bottom of the client's nested
+    generators, whereas ``aclose()`` would leave those to the garbage collector.
+    """
+    chunks = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in stream:
+                chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(None)
+
+    reader = asyncio.create_task(pump())
+    try:
+        while (chunk := await chunks.get()) is not None:
+            if text := stopper.feed(chunk):
+                yield text
+            if stopper.stopped:
+                break
+    finally:
+        reader.cancel()
+        # Let the client finish closing its connection before moving on
+        await asyncio.gather(reader, return_exceptions=True)
+    if not stopper.stopped:
+        # Surfaces an error the stream raised
+        await reader
+    if text := stopper.finish():
+        yield text
+
+
+class GenerationStats:
+    """Thread-safe per-node counts of controlled generations and why they were cut"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.stops = {}
+
+    def record(self, node, reason):
+        with self._lock:
+            self.calls[node] = self.calls.get(node, 0) + 1
+            if reason:
+                stops = self.stops.setdefault(node, {})
+                stops[reason] = stops.get(reason, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            nodes = {}
+            for node, calls in self.calls.items():
+                stops = dict(self.stops.get(node, {}))
+                nodes[node] = {
+                    'calls': calls,
+                    'early_stops': sum(stops.values()),
+                    'early_stop_rate': sum(stops.values()) / calls,
+                    'reasons': stops,
+                }
+            return nodes
+
+
+stats = GenerationStats()
+metrics.add_gauges("generation", lambda: {
+    f"{node}_{name}": value for node, values in stats.snapshot().items()
+    for name, value in values.items() if name != 'reasons'
+})
@@ -0,0 +1,239 @@
+"""Spread LLM calls over one or more Ollama endpoints.
+
+Each graph node gets a ``PooledLLM`` for its model and options from MODEL_REGISTRY.
+Every call goes to the healthy endpoint with the fewest requests in flight (counted
+across all models); endpoints whose /api/tags lists the model are preferred. An
+endpoint that refuses a connection is taken out of rotation and the call retried on
+another one, until the background health check sees it answer again.
+"""
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+from config.settings import (
+    OLLAMA_ENDPOINTS,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_TIMEOUT_SECONDS,
+    OLLAMA_HEALTH_CHECK_SECONDS
+)
+
+# The endpoint itself is unreachable, so another one may still answer. A read timeout
+# is not one of these: a busy endpoint can be slow on a long generation and still be up.
+CONNECTION_ERRORS = (ConnectionError, httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def _tagged(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.healthy = True
+        self.models = None  # names from /api/tags, once checked
+
+
+class EndpointPool:
+    def __init__(self, urls, health_check_seconds=OLLAMA_HEALTH_CHECK_SECONDS):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.health_check_seconds = health_check_seconds
+        self._lock = threading.Lock()
+        self._checker = None
+
+    def _ensure_checker(self):
+        if self._checker is None and self.health_check_seconds:
+            with self._lock:
+                if self._checker is None:
+                    self._checker = threading.Thread(target=self._run_checks, name="ollama-health", daemon=True)
+                    self._checker.start()
+
+    def _run_checks(self):
+        while True:
+            self.check()
+            time.sleep(self.health_check_seconds)
+
+    def check(self):
+        """Probe every endpoint's /api/tags, updating its health and model list"""
+        for endpoint in self.endpoints:
+            try:
+                response = httpx.get(f"{endpoint.url}/api/tags", timeout=5)
+                response.raise_for_status()
+                models, healthy = {m["name"] for m in response.json().get("models", [])}, True
+            except (httpx.HTTPError, ValueError, KeyError):
+                models, healthy = endpoint.models, False
+            with self._lock:
+                if healthy != endpoint.healthy:
+                    print(f"[llm-pool] {endpoint.url} is {'back up' if healthy else 'down'}")
+                endpoint.healthy, endpoint.models = healthy, models
+
+    def acquire(self, model, exclude=()):
+        """Reserve the least busy endpoint for ``model``; None once every endpoint was tried"""
+        self._ensure_checker()
+        with self._lock:
+            untried = [e for e in self.endpoints if e not in exclude]
+            live = [e for e in untried if e.healthy]
+            serving = [e for e in live if e.models is None or _tagged(model) in e.models]
+            # With every endpoint marked down, still try them rather than fail outright
+            candidates = serving or live or untried
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.served))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, error=None):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.served += 1
+            if error is not None:
+                endpoint.failures += 1
+                if endpoint.healthy:
+                    print(f"[llm-pool] {endpoint.url} is down: {error}")
+                endpoint.healthy = False
+
+    def stats(self) -> list:
+        with self._lock:
+            return [
+                {"url": e.url, "healthy": e.healthy, "outstanding": e.outstanding,
+                 "served": e.served, "failures": e.failures}
+                for e in self.endpoints
+            ]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Get the singleton pool over OLLAMA_ENDPOINTS"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = EndpointPool(OLLAMA_ENDPOINTS)
+    return _pool
+
+
+class PooledLLM(LLM):
+    """An Ollama model served by whichever pool endpoint is least busy"""
+    model: str
+    options: dict = {}
+    pool: Any = None
+
+    _clients: dict = PrivateAttr(default_factory=dict)
+    _clients_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model, **self.options}
+
+    def _client(self, endpoint):
+        """One client per endpoint; its httpx clients keep keep-alive connections to it"""
+        with self._clients_lock:
+            if endpoint.url not in self._clients:
+                from langchain_ollama import OllamaLLM
+                self._clients[endpoint.url] = OllamaLLM(
+                    model=self.model,
+                    base_url=endpoint.url,
+                    client_kwargs={
+                        "limits": httpx.Limits(
+                            max_connections=OLLAMA_MAX_CONNECTIONS,
+                            max_keepalive_connections=OLLAMA_MAX_CONNECTIONS
+                        ),
+                        "timeout": OLLAMA_TIMEOUT_SECONDS
+                    },
+                    **self.options
+                )
+            return self._clients[endpoint.url]
+
+    def _endpoints(self):
+        """Endpoints to try in turn, least busy first"""
+        pool = self.pool or get_pool()
+        tried = []
+        while (endpoint := pool.acquire(self.model, tried)) is not None:
+            tried.append(endpoint)
+            yield pool, endpoint
+        raise ConnectionError(f"No Ollama endpoint could serve {self.model}: {[e.url for e in tried]}")
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        for pool, endpoint in self._endpoints():
+            try:
+                result = self._client(endpoint).invoke(prompt, stop=stop, **kwargs)
+            except CONNECTION_ERRORS as e:
+                pool.release(endpoint, e)
+                continue
+            except BaseException:
+                pool.release(endpoint)
+                raise
+            pool.release(endpoint)
+            return result
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        for pool, endpoint in self._endpoints():
+            try:
+                result = await self._client(endpoint).ainvoke(prompt, stop=stop, **kwargs)
+            except CONNECTION_ERRORS as e:
+                pool.release(endpoint, e)
+                continue
+            except BaseException:
+                pool.release(endpoint)
+                raise
+            pool.release(endpoint)
+            return result
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for pool, endpoint in self._endpoints():
+            started = False
+            try:
+                for token in self._client(endpoint).stream(prompt, stop=stop, **kwargs):
+                    started = True
+                    if run_manager:
+                        run_manager.on_llm_new_token(token)
+                    yield GenerationChunk(text=token)
+            except CONNECTION_ERRORS as e:
+                pool.release(endpoint, e)
+                # Tokens already went out; a retry would repeat them
+                if started:
+                    raise
+                continue
+            except BaseException:
+                pool.release(endpoint)
+                raise
+            pool.release(endpoint)
+            return
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        for pool, endpoint in self._endpoints():
+            started = False
+            try:
+                async for token in self._client(endpoint).astream(prompt, stop=stop, **kwargs):
+                    started = True
+                    if run_manager:
+                        await run_manager.on_llm_new_token(token)
+                    yield GenerationChunk(text=token)
+            except CONNECTION_ERRORS as e:
+                pool.release(endpoint, e)
+                if started:
+                    raise
+                continue
+            except BaseException:
+                pool.release(endpoint)
+                raise
+            pool.release(endpoint)
+            return
@@ -0,0 +1,264 @@
+"""Per-request tracing and latency histograms for the assistant pipeline.
+
+Code under measurement wraps itself in ``stage(name)``; every stage becomes a span
+of the current request's trace and an observation in the Prometheus histograms.
+Spans are also handed to any registered sinks, e.g. the JSONL span file writer.
+"""
+import contextvars
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from config.settings import TRACE_FILE
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # stage -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, stage, value):
+        with self._lock:
+            series = self._series.setdefault(stage, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for stage, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} {series[-1]}')
+                lines.append(f'{self.name}_sum{{stage="{stage}"}} {series[-2]}')
+                lines.append(f'{self.name}_count{{stage="{stage}"}} {series[-1]}')
+        return "\n".join(lines)
+
+
+stage_duration = Histogram("assistant_stage_duration_seconds", "Wall time per pipeline stage", DURATION_BUCKETS)
+prompt_tokens = Histogram("assistant_prompt_tokens", "Prompt tokens sent to the LLM", TOKEN_BUCKETS)
+completion_tokens = Histogram("assistant_completion_tokens", "Completion tokens produced by the LLM", TOKEN_BUCKETS)
+tokens_per_second = Histogram("assistant_tokens_per_second", "LLM generation speed", RATE_BUCKETS)
+HISTOGRAMS = [stage_duration, prompt_tokens, completion_tokens, tokens_per_second]
+
+
+class Span:
+    def __init__(self, trace_id, name, parent=None):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = {}
+
+    @property
+    def duration(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start,
+            "end_time_unix_nano": self.end,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """All spans of one request; the root span covers the whole request"""
+
+    def __init__(self, name="request"):
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(self.trace_id, name)
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def breakdown(self):
+        """Per-stage rows for the last-request debug view"""
+        return [
+            {"stage": span.name, "seconds": round(span.duration, 4), **span.attributes}
+            for span in self.spans
+        ]
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_active_traces = weakref.WeakValueDictionary()  # traces are owned by their requests
+_last_trace = None
+_sinks = []
+
+
+def add_sink(sink):
+    """Register a callable that receives every finished span"""
+    _sinks.append(sink)
+
+
+def start_trace(name="request"):
+    trace = Trace(name)
+    _active_traces[trace.trace_id] = trace
+    return trace
+
+
+def get_trace(trace_id):
+    return _active_traces.get(trace_id)
+
+
+def finish_trace(trace, **attributes):
+    global _last_trace
+    trace.root.attributes.update(attributes)
+    _finish_span(trace.root)
+    _active_traces.pop(trace.trace_id, None)
+    _last_trace = trace
+
+
+def last_trace():
+    return _last_trace
+
+
+@contextmanager
+def use_trace(trace):
+    """Make ``trace`` the current trace for code running in this context"""
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root if trace else None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+@contextmanager
+def stage(name, **attributes):
+    """Time a pipeline stage as a span of the current trace (if any) and a histogram sample"""
+    trace = _current_trace.get()
+    span = Span(trace.trace_id if trace else "", name, parent=_current_span.get())
+    span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+        _finish_span(span)
+        if trace:
+            trace.add(span)
+
+
+def traced_node(name, func):
+    """Run a graph node as a stage of the trace whose id is in config["configurable"]["trace_id"].
+
+    Trace ids travel in the graph config because the node may run in another thread
+    or task than the caller; inside the node the trace is a context variable again.
+    """
+    def resolve(config):
+        trace_id = (config or {}).get("configurable", {}).get("trace_id")
+        return get_trace(trace_id) or _current_trace.get()
+
+    if inspect.iscoroutinefunction(func):
+        async def node(state, config):
+            with use_trace(resolve(config)), stage(name):
+                return await func(state)
+    else:
+        def node(state, config):
+            with use_trace(resolve(config)), stage(name):
+                return func(state)
+    node.__name__ = func.__name__
+    return node
+
+
+def annotate(**attributes):
+    """Attach attributes to the innermost open span"""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def record_llm_call(span, prompt, completion, first_token_seconds=None):
+    """Token counts and generation speed for an LLM call timed by ``span``"""
+    from utils.context_packer import count_tokens
+    n_prompt, n_completion = count_tokens(prompt), count_tokens(completion)
+    generation_seconds = span.duration - (first_token_seconds or 0)
+    span.attributes.update(prompt_tokens=n_prompt, completion_tokens=n_completion)
+    if first_token_seconds is not None:
+        span.attributes["first_token_seconds"] = round(first_token_seconds, 4)
+    if generation_seconds > 0:
+        span.attributes["tokens_per_second"] = round(n_completion / generation_seconds, 2)
+
+
+def _finish_span(span):
+    span.end = time.time_ns()
+    stage_duration.observe(span.name, span.duration)
+    attributes = span.attributes
+    if "prompt_tokens" in attributes:
+        prompt_tokens.observe(span.name, attributes["prompt_tokens"])
+    if "completion_tokens" in attributes:
+        completion_tokens.observe(span.name, attributes["completion_tokens"])
+    if "tokens_per_second" in attributes:
+        tokens_per_second.observe(span.name, attributes["tokens_per_second"])
+    for sink in _sinks:
+        try:
+            sink(span)
+        except Exception as e:
+            print(f"Span sink failed: {e}")
+
+
+_gauge_sources = []
+
+
+def add_gauges(prefix, source):
+    """Expose the numbers in ``source()`` (a dict) as gauges named assistant_<prefix>_<key>"""
+    _gauge_sources.append((prefix, source))
+
+
+def render_gauges():
+    lines = []
+    for prefix, source in _gauge_sources:
+        for key, value in sorted(source().items()):
+            name = f"assistant_{prefix}_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines)
+
+
+def render_prometheus():
+    """All histograms and gauges in the Prometheus text exposition format"""
+    return "\n".join([h.render() for h in HISTOGRAMS] + [render_gauges()]) + "\n"
+
+
+class SpanFileWriter:
+    """Sink that appends spans as JSON lines (OpenTelemetry-style fields)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        line = json.dumps(span.to_dict())
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+if TRACE_FILE:
+    os.makedirs(os.path.dirname(os.path.abspath(TRACE_FILE)), exist_ok=True)
+    add_sink(SpanFileWriter(TRACE_FILE))
@@ -0,0 +1,189 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config.settings import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_PATH,
+)
+
+
+def normalize_question(question: str) -> str:
+    # Case is kept: it is the exact-match key for explanations, and identifiers are case-sensitive
+    return re.sub(r"\s+", " ", question.strip())
+
+
+class SemanticCache:
+    """Answer cache keyed on question embeddings.
+
+    A lookup returns the stored (classification, answer) of the most similar previous
+    question when the cosine similarity clears ``threshold``. Entries are evicted LRU
+    beyond ``max_entries`` and dropped after ``ttl_seconds``; the whole cache is cleared
+    when the vectorstore version stamp changes. Explanations are only reused for the
+    exact same input, since two snippets that differ by one operator embed almost
+    identically.
+    """
+
+    def __init__(self, embed, version, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+                 db_path=SEMANTIC_CACHE_PATH):
+        self.embed = embed
+        self.version = version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._recent_vectors = OrderedDict()
+        self._lock = threading.RLock()
+        self._db = None
+        self._version = version()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, embedding BLOB, classification TEXT, answer TEXT, "
+                "created REAL, last_access REAL, version TEXT)"
+            )
+            self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._db.execute("DELETE FROM entries WHERE created < ? OR version != ?", (cutoff, self._version))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT key, embedding, classification, answer, created FROM entries "
+            "ORDER BY last_access DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, blob, classification, answer, created in reversed(rows):
+            self._entries[key] = {
+                'vector': np.frombuffer(blob, dtype=np.float32),
+                'classification': classification,
+                'answer': answer,
+                'created': created,
+            }
+
+    def _vector(self, key):
+        # Lookup and store for the same question share one embedding call. The encoder
+        # runs outside the lock, so concurrent requests embed (and batch) in parallel.
+        with self._lock:
+            vector = self._recent_vectors.get(key)
+        if vector is None:
+            vector = np.asarray(self.embed(key), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            with self._lock:
+                self._recent_vectors[key] = vector
+                if len(self._recent_vectors) > 64:
+                    self._recent_vectors.popitem(last=False)
+        return vector
+
+    def _check_version(self):
+        version = self.version()
+        if version != self._version:
+            self._version = version
+            self.clear()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry['created'] < cutoff]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._matrix = None
+        if self._db:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+
+    def lookup(self, question: str):
+        """Return (classification, answer) of a similar cached question, or None"""
+        key = normalize_question(question)
+        vector = self._vector(key)
+        with self._lock:
+            self._check_version()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([self._entries[k]['vector'] for k in self._matrix_keys])
+            keys = self._matrix_keys
+            similarities = self._matrix @ vector
+            best = int(similarities.argmax())
+            entry = self._entries[keys[best]]
+            exact_only = 'explain' in entry['classification'].lower()
+            if similarities[best] < self.threshold or (exact_only and keys[best] != key):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(keys[best])
+            if self._db:
+                self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), keys[best]))
+                self._db.commit()
+            return entry['classification'], entry['answer']
+
+    def store(self, question: str, classification: str, answer: str):
+        key = normalize_question(question)
+        vector = self._vector(key)
+        with self._lock:
+            self._check_version()
+            now = time.time()
+            self._entries[key] = {'vector': vector, 'classification': classification, 'answer': answer, 'created': now}
+            self._entries.move_to_end(key)
+            self._matrix = None
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, vector.tobytes(), classification, answer, now, now, self._version)
+                )
+                self._db.commit()
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            if self._db:
+                self._db.execute("DELETE FROM entries")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache():
+    """Get the singleton semantic cache, or None when it is disabled"""
+    global _semantic_cache
+    if _semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                from vectorstore.retriever import get_embedding_model, get_vectorstore_version
+                _semantic_cache = SemanticCache(
+                    embed=lambda text: get_embedding_model().embed_query(text),
+                    version=get_vectorstore_version
+                )
+    return _semantic_cache
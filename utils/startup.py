@@ -0,0 +1,48 @@
+import threading
+import time
+from config.settings import MODEL_REGISTRY, RETRIEVER_MODE, SEMANTIC_CACHE_ENABLED
+
+_ready = threading.Event()
+_status = {"state": "cold", "seconds": None, "error": None}
+_lock = threading.Lock()
+
+def warm_up():
+    """Load the models and indexes a first request would otherwise pay for"""
+    with _lock:
+        if _ready.is_set():
+            return
+        _status["state"] = "warming"
+        start = time.perf_counter()
+        try:
+            from agents.nodes import get_llm
+            from tools.tools import get_retriever_tool
+            from utils.context_packer import get_tokenizer
+            for node in MODEL_REGISTRY:
+                get_llm(node)
+            get_retriever_tool()
+            get_tokenizer()
+            if RETRIEVER_MODE == "hybrid":
+                from vectorstore.lexical import get_bm25_index
+                get_bm25_index()
+            if RETRIEVER_MODE != "hybrid" or SEMANTIC_CACHE_ENABLED:
+                from vectorstore.retriever import get_vectorstore
+                get_vectorstore()
+        except Exception as e:
+            # Components still load lazily on first use; report the failure instead of crashing
+            _status.update(state="failed", error=str(e))
+            print(f"Warm-up failed: {e}")
+            return
+        _status.update(state="ready", seconds=time.perf_counter() - start)
+        _ready.set()
+        print(f"Warm-up finished in {_status['seconds']:.1f}s")
+
+def start_background_warm_up():
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def readiness() -> dict:
+    return {"ready": is_ready(), **_status}
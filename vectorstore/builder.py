@@ -32,19 +32,206 @@
 
 #     print("Chroma DB created and persisted.")
 #     return vectorstore
+import hashlib
+import json
 import os
+import shutil
+import time
 from datasets import load_dataset
 from langchain_core.documents import Document
 from langchain_chroma import Chroma
-from vectorstore.retriever import get_embedding_model
-from utils.code_splitter import split_code_by_function
-from config.settings import PERSIST_DIR
+from vectorstore.retriever import get_embedding_model, get_vectorstore_version, bump_vectorstore_version
+from vectorstore import lexical
+from utils.code_splitter import iter_code_chunks
+from config.settings import (
+    PERSIST_DIR,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    EMBED_MAX_SEQ_LENGTH,
+    BUILD_CHECKPOINT_FILE,
+    VECTOR_BACKEND,
+    MMAP_INDEX_DIR
+)
 
-def build_vectorstore(force_rebuild=False):
-    """Build or load the vectorstore"""
+def load_humaneval_documents():
+    """Yield one document per HumanEval task (prompt + canonical solution)"""
+    ds = load_dataset("openai_humaneval")["test"]
+    for row in ds:
+        yield Document(
+            page_content=f"{row['prompt']}\n\n# Solution:\n{row['canonical_solution']}",
+            metadata={"id": row["task_id"], "type": "code_example"}
+        )
+
+def chunk_id(corpus, doc):
+    """Content-addressed ID: unchanged chunks keep their ID across builds"""
+    source = doc.metadata.get("id", "")
+    return hashlib.sha256(f"{corpus}\0{source}\0{doc.page_content}".encode()).hexdigest()[:32]
+
+def iter_chunks(documents, corpus):
+    """Split documents and yield (id, chunk) pairs tagged with their corpus"""
+    for doc in documents:
+        for chunk in iter_code_chunks(doc):
+            chunk = Document(
+                page_content=chunk.page_content,
+                metadata={**chunk.metadata, "corpus": corpus}
+            )
+            yield chunk_id(corpus, chunk), chunk
+
+def _read_checkpoint(corpus):
+    try:
+        with open(BUILD_CHECKPOINT_FILE) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return checkpoint if checkpoint.get("corpus") == corpus else None
+
+def _write_checkpoint(corpus, embedded, started):
+    with open(BUILD_CHECKPOINT_FILE, "w") as f:
+        json.dump({"corpus": corpus, "embedded": embedded, "started": started, "updated": time.time()}, f)
+
+def _drop_legacy_chunks(collection, lexical_index):
+    """Remove chunks written before incremental indexing (random IDs, no corpus tag)"""
+    existing = collection.get(include=["metadatas"])
+    legacy = [i for i, meta in zip(existing["ids"], existing["metadatas"]) if not (meta or {}).get("corpus")]
+    for start in range(0, len(legacy), EMBED_BATCH_SIZE):
+        collection.delete(ids=legacy[start:start + EMBED_BATCH_SIZE])
+    lexical_index.remove(legacy)
+    if legacy:
+        print(f"Removed {len(legacy)} legacy chunks without a corpus tag")
+    return len(legacy)
+
+def _existing_ids(collection, corpus, sources, batch_size):
+    if sources is None:
+        return set(collection.get(where={"corpus": corpus}, include=[])["ids"])
+    existing = set()
+    for start in range(0, len(sources), batch_size):
+        where = {"$and": [{"corpus": corpus}, {"source": {"$in": sources[start:start + batch_size]}}]}
+        existing.update(collection.get(where=where, include=[])["ids"])
+    return existing
+
+def index_documents(documents, corpus, vectorstore=None, batch_size=EMBED_BATCH_SIZE,
+                    workers=EMBED_WORKERS, max_seq_length=EMBED_MAX_SEQ_LENGTH, sources=None):
+    """Incrementally index a corpus into the vectorstore.
+
+    Chunks are identified by a hash of their content, so only new or changed chunks
+    are embedded, and chunks of this corpus that no longer appear are deleted. Each
+    batch is upserted as soon as it is embedded, which makes an interrupted build
+    resumable: the next run finds those IDs already present and skips them.
+    With ``workers`` > 1 embedding runs on a process pool (see vectorstore.ingest).
+    ``sources`` limits the update to chunks with those "source" paths: chunks of other
+    files in the corpus are left alone, and listed files without documents are deleted.
+    Returns a summary dict with counts and the embedding rate.
+    """
+    if vectorstore is None:
+        # Parallel ingestion embeds in the workers, so skip loading a model here
+        vectorstore = Chroma(
+            persist_directory=PERSIST_DIR,
+            embedding_function=get_embedding_model() if workers <= 1 else None
+        )
+    collection = vectorstore._collection
+    # The BM25 index is kept in step with the collection and saved with the new version stamp.
+    # An interrupted build (of any corpus) upserted chunks the saved index never got: rebuild it.
+    interrupted = os.path.exists(BUILD_CHECKPOINT_FILE)
+    if interrupted:
+        print("Rebuilding BM25 index from the Chroma collection after an interrupted build...")
+        lexical_index = lexical.BM25Index.from_collection(collection)
+        lexical_index.version = get_vectorstore_version()
+    else:
+        lexical_index = lexical.load_or_build(collection, get_vectorstore_version())
+    removed_legacy = _drop_legacy_chunks(collection, lexical_index)
+    existing = _existing_ids(collection, corpus, None if sources is None else list(sources), batch_size)
+
+    checkpoint = _read_checkpoint(corpus)
+    if checkpoint:
+        print(f"Resuming interrupted build of '{corpus}' "
+              f"({checkpoint['embedded']} chunks were embedded before it stopped)")
+    started = checkpoint["started"] if checkpoint else time.time()
+
+    seen = set()
+    embedded = 0
+    embed_seconds = 0.0
+
+    def new_chunks():
+        for doc_id, chunk in iter_chunks(documents, corpus):
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            if doc_id not in existing:
+                yield doc_id, chunk
+
+    def record(ids, docs, seconds):
+        nonlocal embedded, embed_seconds
+        lexical_index.add(ids, docs)
+        embedded += len(ids)
+        embed_seconds += seconds
+        _write_checkpoint(corpus, embedded, started)
+        print(f"Embedded {embedded} chunks ({embedded / embed_seconds:.1f} chunks/sec)")
+
+    if workers > 1:
+        # Embedding happens in worker processes; this process is the single writer
+        from vectorstore.ingest import parallel_embed
+        start = time.perf_counter()
+        for ids, docs, vectors in parallel_embed(new_chunks(), workers, batch_size, max_seq_length):
+            collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                documents=[doc.page_content for doc in docs],
+                metadatas=[doc.metadata for doc in docs]
+            )
+            record(ids, docs, time.perf_counter() - start)
+            start = time.perf_counter()
+    else:
+        batch_ids, batch_docs = [], []
+        for doc_id, chunk in new_chunks():
+            batch_ids.append(doc_id)
+            batch_docs.append(chunk)
+            if len(batch_ids) >= batch_size:
+                start = time.perf_counter()
+                vectorstore.add_documents(batch_docs, ids=batch_ids)
+                record(batch_ids, batch_docs, time.perf_counter() - start)
+                batch_ids, batch_docs = [], []
+        if batch_ids:
+            start = time.perf_counter()
+            vectorstore.add_documents(batch_docs, ids=batch_ids)
+            record(batch_ids, batch_docs, time.perf_counter() - start)
+
+    stale = list(existing - seen)
+    for start in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[start:start + batch_size])
+    lexical_index.remove(stale)
+
+    if os.path.exists(BUILD_CHECKPOINT_FILE):
+        os.remove(BUILD_CHECKPOINT_FILE)
+    if embedded or stale or removed_legacy or interrupted:
+        lexical_index.version = bump_vectorstore_version()
+        lexical_index.save()
+    # The mmap backend searches a snapshot of the collection; refresh it with the new version
+    mmap_stale = not os.path.exists(os.path.join(MMAP_INDEX_DIR, "info.json"))
+    if VECTOR_BACKEND == "mmap" and (embedded or stale or removed_legacy or interrupted or mmap_stale):
+        from vectorstore.mmap_index import export_from_chroma
+        export_from_chroma(collection, version=get_vectorstore_version())
+
+    summary = {
+        "corpus": corpus,
+        "chunks": len(seen),
+        "embedded": embedded,
+        "unchanged": len(seen) - embedded,
+        "deleted": len(stale),
+        "chunks_per_sec": embedded / embed_seconds if embed_seconds else 0.0,
+    }
+    print(f"Indexed '{corpus}': {summary['embedded']} embedded, {summary['unchanged']} unchanged, "
+          f"{summary['deleted']} deleted ({summary['chunks_per_sec']:.1f} chunks/sec)")
+    return summary
+
+def build_vectorstore(force_rebuild=False, update=False):
+    """Build or load the vectorstore.
+
+    By default an existing, non-empty store is loaded as is. ``update`` re-indexes
+    the HumanEval corpus incrementally; ``force_rebuild`` wipes the store first.
+    """
     
     # Check if vectorstore exists and is not empty
-    if os.path.exists(PERSIST_DIR) and not force_rebuild:
+    if os.path.exists(PERSIST_DIR) and not force_rebuild and not update:
         print("Loading existing Chroma DB...")
         try:
             vectorstore = Chroma(
@@ -63,51 +250,17 @@ def build_vectorstore(force_rebuild=False):
             print(f"Error loading existing vectorstore: {e}")
             print("Rebuilding vectorstore...")
     
-    print("Building new Chroma DB from dataset...")
-    
-    # Load dataset
-    ds = load_dataset("openai_humaneval")["test"]
-    examples = [
-        {
-            "id": row["task_id"], 
-            "prompt": row["prompt"], 
-            "solution": row["canonical_solution"]
-        } 
-        for row in ds
-    ]
-    
-    print(f"Loaded {len(examples)} examples from dataset")
-    
-    # Create raw documents
-    raw_documents = [
-        Document(
-            page_content=f"{ex['prompt']}\n\n# Solution:\n{ex['solution']}",
-            metadata={"id": ex["id"], "type": "code_example"}
-        ) 
-        for ex in examples
-    ]
-    
-    # Split documents by function
-    split_documents = []
-    for doc in raw_documents:
-        split_docs = split_code_by_function(doc)
-        split_documents.extend(split_docs)
-    
-    print(f"Split into {len(split_documents)} document chunks")
-    
     # Remove existing directory if rebuilding
     if force_rebuild and os.path.exists(PERSIST_DIR):
-        import shutil
         shutil.rmtree(PERSIST_DIR)
         os.makedirs(PERSIST_DIR, exist_ok=True)
     
-    # Create vectorstore
-    embedding_model = get_embedding_model()
-    vectorstore = Chroma.from_documents(
-        documents=split_documents,
-        embedding=embedding_model,
-        persist_directory=PERSIST_DIR
+    print("Indexing HumanEval into Chroma DB...")
+    vectorstore = Chroma(
+        persist_directory=PERSIST_DIR,
+        embedding_function=get_embedding_model()
     )
+    index_documents(load_humaneval_documents(), corpus="humaneval", vectorstore=vectorstore)
     
     print("Chroma DB created and persisted.")
     
@@ -115,4 +268,13 @@ def build_vectorstore(force_rebuild=False):
     test_results = vectorstore.similarity_search("def", k=1)
     print(f"Verification: Found {len(test_results)} test results")
     
-    return vectorstore
\ No newline at end of file
+    return vectorstore
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or update the code vectorstore")
+    parser.add_argument("--update", action="store_true", help="Incrementally re-index HumanEval")
+    parser.add_argument("--force-rebuild", action="store_true", help="Wipe the store and index from scratch")
+    args = parser.parse_args()
+    build_vectorstore(force_rebuild=args.force_rebuild, update=args.update)
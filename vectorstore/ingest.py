@@ -0,0 +1,268 @@
+"""Streaming ingestion of source directories and git repositories.
+
+    python -m vectorstore.ingest path/to/repo --language python --language go --changed
+
+Files are listed (honouring .gitignore), read, split and embedded one bounded batch
+at a time, so memory does not grow with the size of the corpus. In a git repository
+the indexed commit is recorded per corpus; ``--changed`` then re-ingests only the
+files changed since it.
+"""
+import fnmatch
+import json
+import os
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+from langchain_core.documents import Document
+from config.settings import (
+    EMBEDDING_MODEL_NAME,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    EMBED_MAX_SEQ_LENGTH,
+    INGEST_STATE_FILE,
+    INGEST_MAX_FILE_BYTES,
+)
+
+# Only Python is split by its syntax tree; other languages are cut into line windows
+LANGUAGE_EXTENSIONS = {
+    "python": (".py",),
+    "javascript": (".js", ".jsx", ".mjs"),
+    "typescript": (".ts", ".tsx"),
+    "java": (".java",),
+    "go": (".go",),
+    "rust": (".rs",),
+    "c": (".c", ".h"),
+    "cpp": (".cc", ".cpp", ".hpp"),
+    "shell": (".sh",),
+}
+
+# Per-process model, loaded once by the pool initializer
+_worker_model = None
+
+def _init_worker(model_name, max_seq_length, threads):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # Split the cores between workers instead of letting every process grab all of them
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+    _worker_model.max_seq_length = max_seq_length
+
+def _embed_batch(ids, texts):
+    # Same normalization as get_embedding_model, so vectors are interchangeable
+    vectors = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+    return ids, vectors.tolist()
+
+def language_of(path):
+    for language, extensions in LANGUAGE_EXTENSIONS.items():
+        if path.endswith(extensions):
+            return language
+    return None
+
+def _git(root, *args):
+    return subprocess.run(["git", "-C", root, *args], capture_output=True, text=True, check=True).stdout
+
+def git_head(root):
+    """HEAD commit of the repository containing ``root``, or None outside a repository"""
+    try:
+        return _git(root, "rev-parse", "HEAD").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _ignore_patterns(root):
+    try:
+        with open(os.path.join(root, ".gitignore")) as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith(("#", "!"))]
+    except OSError:
+        return []
+
+def _ignored(relpath, is_dir, patterns):
+    """Basic .gitignore matching: globs on the name, or on the path when they contain a slash"""
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip("/")
+        if "/" in pattern:
+            if fnmatch.fnmatch(relpath, pattern.lstrip("/")):
+                return True
+        elif fnmatch.fnmatch(os.path.basename(relpath), pattern):
+            return True
+    return False
+
+def list_source_files(root):
+    """Relative paths of the files under ``root``, honouring .gitignore.
+
+    Inside a git repository git decides (tracked plus untracked, non-ignored files);
+    elsewhere hidden directories and the patterns in ``root``/.gitignore are skipped.
+    """
+    try:
+        listed = _git(root, "ls-files", "-z", "--cached", "--others", "--exclude-standard")
+        return sorted(path for path in listed.split("\0") if path)
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    patterns = _ignore_patterns(root)
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        reldir = os.path.relpath(dirpath, root)
+        reldir = "" if reldir == "." else reldir
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if not d.startswith(".") and d != "__pycache__" and not _ignored(os.path.join(reldir, d), True, patterns)
+        )
+        paths.extend(
+            os.path.join(reldir, f) for f in sorted(filenames)
+            if not _ignored(os.path.join(reldir, f), False, patterns)
+        )
+    return paths
+
+def changed_files(root, since):
+    """Files changed since commit ``since``: edits and deletions (committed or not) plus
+    untracked files. None when the commit is unknown, e.g. after a history rewrite."""
+    try:
+        changed = _git(root, "diff", "--name-only", "--no-renames", "--relative", "-z", since, "--")
+        untracked = _git(root, "ls-files", "-z", "--others", "--exclude-standard")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return sorted({path for path in (changed + untracked).split("\0") if path})
+
+def iter_directory_documents(root, languages=("python",), paths=None):
+    """Stream one document per source file of ``languages`` under ``root``.
+
+    ``paths`` (relative to ``root``) restricts the walk to those files.
+    """
+    for source in list_source_files(root) if paths is None else paths:
+        language = language_of(source)
+        if language not in languages:
+            continue
+        path = os.path.join(root, source)
+        try:
+            if os.path.getsize(path) > INGEST_MAX_FILE_BYTES:
+                print(f"Skipping {source}: larger than {INGEST_MAX_FILE_BYTES} bytes")
+                continue
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except (UnicodeDecodeError, OSError):
+            continue
+        yield Document(page_content=text, metadata={"id": source, "source": source, "language": language})
+
+def _read_state():
+    try:
+        with open(INGEST_STATE_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _write_state(state):
+    with open(INGEST_STATE_FILE, "w") as f:
+        json.dump(state, f, indent=2)
+
+def ingest(path, corpus=None, languages=("python",), changed_only=False, batch_size=EMBED_BATCH_SIZE,
+           workers=EMBED_WORKERS, max_seq_length=EMBED_MAX_SEQ_LENGTH):
+    """Index a directory or repository as its own corpus; returns index_documents' summary"""
+    from vectorstore.builder import index_documents
+    root = os.path.abspath(path)
+    corpus = corpus or os.path.basename(root)
+    head = git_head(root)
+    state = _read_state()
+    last = state.get(corpus, {}).get("commit")
+
+    sources = None
+    if changed_only and head and last:
+        changed = changed_files(root, last)
+        if changed is None:
+            print(f"Commit {last[:12]} of '{corpus}' not found, ingesting every file")
+        else:
+            sources = [source for source in changed if language_of(source) in languages]
+            print(f"{len(sources)} files changed since {last[:12]}")
+    elif changed_only:
+        print(f"No indexed commit recorded for '{corpus}', ingesting every file")
+
+    summary = index_documents(
+        iter_directory_documents(root, languages, paths=sources),
+        corpus=corpus,
+        batch_size=batch_size,
+        workers=workers,
+        max_seq_length=max_seq_length,
+        sources=sources
+    )
+    if head:
+        state[corpus] = {"commit": head, "root": root, "languages": list(languages)}
+        _write_state(state)
+    return summary
+
+def length_bucketed_batches(chunks, batch_size, bucket_batches=8):
+    """Group (id, chunk) pairs into batches of similar length.
+
+    Buffers ``bucket_batches`` batches worth of chunks, sorts them by length and
+    cuts them into batches, so each batch is padded to a similar sequence length.
+    """
+    buffer = []
+    for item in chunks:
+        buffer.append(item)
+        if len(buffer) >= batch_size * bucket_batches:
+            yield from _cut(buffer, batch_size)
+            buffer = []
+    if buffer:
+        yield from _cut(buffer, batch_size)
+
+def _cut(buffer, batch_size):
+    buffer.sort(key=lambda item: len(item[1].page_content))
+    for start in range(0, len(buffer), batch_size):
+        yield buffer[start:start + batch_size]
+
+def parallel_embed(chunks, workers=EMBED_WORKERS, batch_size=EMBED_BATCH_SIZE,
+                   max_seq_length=EMBED_MAX_SEQ_LENGTH):
+    """Embed (id, chunk) pairs on a pool of worker processes.
+
+    Yields (ids, documents, embeddings) per batch in completion order. At most two
+    batches per worker are in flight, so memory stays bounded however large the
+    input stream is.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(EMBEDDING_MODEL_NAME, max_seq_length, threads)
+    ) as pool:
+        pending = {}
+        for batch in length_bucketed_batches(chunks, batch_size):
+            ids = [doc_id for doc_id, _ in batch]
+            future = pool.submit(_embed_batch, ids, [doc.page_content for _, doc in batch])
+            pending[future] = [doc for _, doc in batch]
+            if len(pending) >= 2 * workers:
+                yield from _drain(pending, FIRST_COMPLETED)
+        yield from _drain(pending)
+
+def _drain(pending, return_when="ALL_COMPLETED"):
+    done, _ = wait(list(pending), return_when=return_when)
+    for future in done:
+        ids, vectors = future.result()
+        yield ids, pending.pop(future), vectors
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index a directory or git repository into the vectorstore")
+    parser.add_argument("path", help="Directory or repository to ingest")
+    parser.add_argument("--corpus", help="Corpus name (defaults to the directory name)")
+    parser.add_argument("--language", action="append", choices=sorted(LANGUAGE_EXTENSIONS),
+                        help="Languages to ingest, repeatable (default: python)")
+    parser.add_argument("--changed", action="store_true",
+                        help="Only re-ingest files changed since the last indexed commit")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--max-seq-length", type=int, default=EMBED_MAX_SEQ_LENGTH)
+    args = parser.parse_args()
+
+    ingest(
+        args.path,
+        corpus=args.corpus,
+        languages=tuple(args.language or ["python"]),
+        changed_only=args.changed,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_seq_length=args.max_seq_length
+    )
@@ -0,0 +1,157 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from langchain_core.documents import Document
+from config.settings import BM25_INDEX_PATH
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize_code(text: str):
+    """Identifier-aware tokens: each identifier plus its snake_case/camelCase parts.
+
+    ``has_close_elements`` yields has_close_elements, has, close, elements and
+    ``parseHTTPResponse`` yields parsehttpresponse, parse, http, response.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        lowered = identifier.lower()
+        tokens.append(lowered)
+        parts = [p.lower() for piece in identifier.split("_") for p in CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return [t for t in tokens if len(t) > 1]
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring.
+
+    Stores page content and metadata too, so lexical hits can be returned without
+    touching Chroma or the embedding model.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.version = None
+        self.docs = {}                     # id -> (page_content, metadata)
+        self.lengths = {}                  # id -> number of tokens
+        self.postings = defaultdict(dict)  # term -> {id: term frequency}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, ids, documents):
+        for doc_id, doc in zip(ids, documents):
+            if doc_id in self.docs:
+                self.remove([doc_id])
+            counts = Counter(tokenize_code(doc.page_content))
+            self.docs[doc_id] = (doc.page_content, doc.metadata)
+            self.lengths[doc_id] = sum(counts.values())
+            self._total_length += self.lengths[doc_id]
+            for term, count in counts.items():
+                self.postings[term][doc_id] = count
+
+    def remove(self, ids):
+        for doc_id in ids:
+            if doc_id not in self.docs:
+                continue
+            for term in set(tokenize_code(self.docs[doc_id][0])):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self.postings[term]
+            self._total_length -= self.lengths.pop(doc_id)
+            del self.docs[doc_id]
+
+    def search(self, query: str, k=5):
+        """Return up to k (id, score) pairs, best first"""
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avg_length = self._total_length / n
+        scores = defaultdict(float)
+        for term in set(tokenize_code(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def document(self, doc_id):
+        page_content, metadata = self.docs[doc_id]
+        return Document(id=doc_id, page_content=page_content, metadata=metadata)
+
+    def save(self, path=BM25_INDEX_PATH):
+        # Postings are rebuilt on load; only the documents need to be stored
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version, "docs": self.docs}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=BM25_INDEX_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        index = cls()
+        index.version = data["version"]
+        ids = list(data["docs"])
+        index.add(ids, [Document(page_content=c, metadata=m) for c, m in (data["docs"][i] for i in ids)])
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=1000):
+        """Build the index from the documents already stored in a Chroma collection"""
+        index = cls()
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            index.add(batch["ids"], [
+                Document(page_content=content or "", metadata=metadata or {})
+                for content, metadata in zip(batch["documents"], batch["metadatas"])
+            ])
+            offset += len(batch["ids"])
+        return index
+
+def load_or_build(collection, version, path=BM25_INDEX_PATH):
+    """Load the saved index if it matches ``version``, otherwise rebuild it from Chroma"""
+    index = None
+    if os.path.exists(path):
+        try:
+            index = BM25Index.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load BM25 index, rebuilding: {e}")
+    if index is None or index.version != version:
+        print("Building BM25 index from the Chroma collection...")
+        index = BM25Index.from_collection(collection)
+        index.version = version
+        index.save(path)
+    return index
+
+_bm25_index = None
+_bm25_lock = threading.Lock()
+
+def get_bm25_index():
+    """Get the BM25 index for the current vectorstore version.
+
+    Rebuilding from the Chroma collection only reads stored documents, so the
+    embedding model is never needed here.
+    """
+    global _bm25_index
+    from vectorstore.retriever import get_vectorstore_version
+    version = get_vectorstore_version()
+    with _bm25_lock:
+        if _bm25_index is None or _bm25_index.version != version:
+            from langchain_chroma import Chroma
+            from config.settings import PERSIST_DIR
+            _bm25_index = load_or_build(Chroma(persist_directory=PERSIST_DIR)._collection, version)
+        return _bm25_index
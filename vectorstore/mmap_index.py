@@ -0,0 +1,305 @@
+"""Read-only vector index in memory-mapped NumPy files, an alternative to Chroma for search.
+
+Chroma stays the store that indexing writes to; this index is a snapshot exported
+from it (automatically after each build when VECTOR_BACKEND is "mmap"):
+
+    python -m vectorstore.mmap_index [--dtype int8] [--ivf-lists 256]
+
+Layout of the index directory:
+    info.json         dtype, dimension, row count, IVF lists, vectorstore version
+    vectors.npy       (rows, dim) float16, or int8 with per-row scales in scales.npy
+    docs.jsonl        one {"id", "page_content", "metadata"} object per line
+    doc_offsets.npy   (rows, 2) byte range of each row's line in docs.jsonl
+    ids.json          chunk IDs in row order, loaded only by get_by_ids
+    centroids.npy     IVF only: list centroids; rows are stored grouped by list
+    list_offsets.npy  IVF only: first row of each list (plus the row count)
+
+Opening maps the files without reading them, and the pages are shared by every
+process that opens the same index.
+"""
+import json
+import mmap
+import os
+import shutil
+from typing import Any, Iterable, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from config.settings import (
+    MMAP_INDEX_DIR,
+    MMAP_INDEX_DTYPE,
+    MMAP_IVF_LISTS,
+    MMAP_IVF_PROBE
+)
+
+# Rows converted to float32 and scored per matrix-vector product. Flat search time is
+# dominated by that conversion; IVF lists cut it down to the probed rows.
+SEARCH_BLOCK_ROWS = 4096
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _quantize(vectors, dtype):
+    """Return (stored rows, per-row scales or None) for normalized float32 vectors"""
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(np.float16), None
+
+
+def _kmeans(sample, n_lists, iterations=10, seed=0):
+    """Spherical k-means centroids for the IVF coarse partition"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+    for _ in range(iterations):
+        assignment = (sample @ centroids.T).argmax(axis=1)
+        for i in range(n_lists):
+            members = sample[assignment == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+def write_index(path, batches, count, dim, dtype=MMAP_INDEX_DTYPE, ivf_lists=MMAP_IVF_LISTS, version=None):
+    """Write an index from batches of (ids, vectors, documents, metadatas).
+
+    The index is built next to ``path`` and swapped in at the end, so processes
+    that have the old one open keep working.
+    """
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    vector_file = os.path.join(tmp_path, "vectors.npy")
+    row_dtype = np.int8 if dtype == "int8" else np.float16
+    # An empty array cannot be memory-mapped
+    rows = (np.lib.format.open_memmap(vector_file, mode="w+", dtype=row_dtype, shape=(count, dim))
+            if count else np.zeros((0, dim), dtype=row_dtype))
+    scales = np.ones(count, dtype=np.float32)
+    offsets = np.zeros((count, 2), dtype=np.int64)
+    ids = []
+    with open(os.path.join(tmp_path, "docs.jsonl"), "wb") as docs:
+        for batch_ids, vectors, documents, metadatas in batches:
+            start = len(ids)
+            stored, batch_scales = _quantize(_normalize(vectors), dtype)
+            rows[start:start + len(batch_ids)] = stored
+            if batch_scales is not None:
+                scales[start:start + len(batch_ids)] = batch_scales
+            for i, (doc_id, content, metadata) in enumerate(zip(batch_ids, documents, metadatas)):
+                line = json.dumps({"id": doc_id, "page_content": content or "", "metadata": metadata or {}})
+                offsets[start + i, 0] = docs.tell()
+                docs.write(line.encode() + b"\n")
+                offsets[start + i, 1] = docs.tell()
+            ids.extend(batch_ids)
+    if len(ids) != count:
+        raise ValueError(f"Expected {count} rows, got {len(ids)}")
+
+    n_lists = min(ivf_lists, count) if ivf_lists else 0
+    if n_lists:
+        # Group rows by list so each list is one contiguous slice of vectors.npy
+        sample = rows[np.random.default_rng(0).choice(count, min(count, 64 * n_lists), replace=False)]
+        centroids = _kmeans(_normalize(sample.astype(np.float32)), n_lists)
+        assignment = np.concatenate([
+            (rows[i:i + SEARCH_BLOCK_ROWS].astype(np.float32) @ centroids.T).argmax(axis=1)
+            for i in range(0, count, SEARCH_BLOCK_ROWS)
+        ])
+        order = np.argsort(assignment, kind="stable")
+        grouped = np.lib.format.open_memmap(os.path.join(tmp_path, "grouped.npy"), mode="w+",
+                                            dtype=rows.dtype, shape=rows.shape)
+        for i in range(0, count, SEARCH_BLOCK_ROWS):
+            grouped[i:i + SEARCH_BLOCK_ROWS] = rows[order[i:i + SEARCH_BLOCK_ROWS]]
+        grouped.flush()
+        del rows, grouped
+        os.replace(os.path.join(tmp_path, "grouped.npy"), vector_file)
+        scales, offsets, ids = scales[order], offsets[order], [ids[i] for i in order]
+        list_offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+        np.save(os.path.join(tmp_path, "list_offsets.npy"), list_offsets)
+    elif count:
+        rows.flush()
+        del rows
+    else:
+        np.save(vector_file, rows)
+
+    if dtype == "int8":
+        np.save(os.path.join(tmp_path, "scales.npy"), scales)
+    np.save(os.path.join(tmp_path, "doc_offsets.npy"), offsets)
+    with open(os.path.join(tmp_path, "ids.json"), "w") as f:
+        json.dump(ids, f)
+    with open(os.path.join(tmp_path, "info.json"), "w") as f:
+        json.dump({"dtype": dtype, "dim": dim, "count": count, "ivf_lists": n_lists, "version": version}, f)
+
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def export_from_chroma(collection, path=MMAP_INDEX_DIR, dtype=MMAP_INDEX_DTYPE,
+                       ivf_lists=MMAP_IVF_LISTS, version=None, batch_size=1000):
+    """Snapshot a Chroma collection into an mmap index; returns the number of rows"""
+    count = collection.count()
+    first = collection.get(include=["embeddings"], limit=1)
+    dim = len(first["embeddings"][0]) if count else 0
+
+    def batches():
+        for offset in range(0, count, batch_size):
+            batch = collection.get(include=["embeddings", "documents", "metadatas"],
+                                   limit=batch_size, offset=offset)
+            yield batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"]
+
+    write_index(path, batches(), count, dim, dtype, ivf_lists, version)
+    print(f"Exported {count} vectors to {path} ({dtype}, {ivf_lists or 'no'} IVF lists)")
+    return count
+
+
+class MmapVectorStore(VectorStore):
+    """Brute-force (or IVF-probed) cosine search over a memory-mapped index"""
+
+    def __init__(self, path: str, embedding: Embeddings, n_probe: int = MMAP_IVF_PROBE):
+        with open(os.path.join(path, "info.json")) as f:
+            self.info = json.load(f)
+        self.path = path
+        self.embedding = embedding
+        self.n_probe = n_probe
+        mmap_mode = "r" if self.info["count"] else None
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        self.scales = (np.load(os.path.join(path, "scales.npy"), mmap_mode=mmap_mode)
+                       if self.info["dtype"] == "int8" else None)
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode=mmap_mode)
+        self.centroids = self.list_offsets = None
+        if self.info["ivf_lists"]:
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+        self._docs_file = open(os.path.join(path, "docs.jsonl"), "rb")
+        self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if self.info["count"] else b""
+        # Read now, with the rest of the snapshot: a later export replaces the files on disk
+        with open(os.path.join(path, "ids.json")) as f:
+            self._id_rows = {doc_id: row for row, doc_id in enumerate(json.load(f))}
+
+    @classmethod
+    def load(cls, path=MMAP_INDEX_DIR, embedding=None, expected_version=None):
+        if not os.path.exists(os.path.join(path, "info.json")):
+            raise FileNotFoundError(f"No mmap index at {path}; export one with `python -m vectorstore.mmap_index`")
+        store = cls(path, embedding)
+        if expected_version is not None and store.info.get("version") != expected_version:
+            print(f"Warning: mmap index at {path} is older than the vectorstore; re-export it")
+        return store
+
+    @staticmethod
+    def exported_version(path=MMAP_INDEX_DIR):
+        """Version stamp of the index currently on disk at ``path``"""
+        try:
+            with open(os.path.join(path, "info.json")) as f:
+                return json.load(f).get("version")
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self):
+        return self.info["count"]
+
+    def _block_scores(self, query, start, stop):
+        block = self.vectors[start:stop].astype(np.float32)
+        scores = block @ query
+        if self.scales is not None:
+            scores *= self.scales[start:stop]
+        return scores
+
+    def _top_k(self, query, k, ranges):
+        candidates, candidate_scores = [], []
+        for start, stop in ranges:
+            for block_start in range(start, stop, SEARCH_BLOCK_ROWS):
+                block_stop = min(stop, block_start + SEARCH_BLOCK_ROWS)
+                scores = self._block_scores(query, block_start, block_stop)
+                if len(scores) > k:
+                    best = np.argpartition(-scores, k)[:k]
+                    scores = scores[best]
+                    rows = best + block_start
+                else:
+                    rows = np.arange(block_start, block_stop)
+                candidates.append(rows)
+                candidate_scores.append(scores)
+        if not candidates:
+            return []
+        rows, scores = np.concatenate(candidates), np.concatenate(candidate_scores)
+        order = np.argsort(-scores)[:k]
+        return list(zip(rows[order].tolist(), scores[order].tolist()))
+
+    def _ranges(self, query):
+        if self.centroids is None:
+            return [(0, len(self))]
+        lists = np.argsort(-(self.centroids @ query))[:self.n_probe]
+        return [(int(self.list_offsets[i]), int(self.list_offsets[i + 1])) for i in sorted(lists)]
+
+    def _document(self, row):
+        start, stop = self.doc_offsets[row]
+        record = json.loads(self._docs[start:stop])
+        return Document(id=record["id"], page_content=record["page_content"], metadata=record["metadata"])
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4):
+        if not len(self):
+            return []
+        query = _normalize(embedding)
+        return [(self._document(row), score) for row, score in self._top_k(query, k, self._ranges(query))]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4, **kwargs: Any):
+        """Same as Chroma's: raw scores, turned into relevance by _select_relevance_score_fn"""
+        return self.similarity_search_with_score_by_vector(embedding, k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1) / 2
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        return [self._document(self._id_rows[doc_id]) for doc_id in ids if doc_id in self._id_rows]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("The mmap index is read-only; index into Chroma and re-export it")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, path: str = MMAP_INDEX_DIR, dtype: str = MMAP_INDEX_DTYPE,
+                   ivf_lists: int = MMAP_IVF_LISTS, **kwargs: Any) -> "MmapVectorStore":
+        texts = list(texts)
+        vectors = embedding.embed_documents(texts)
+        ids = ids or [str(i) for i in range(len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        dim = len(vectors[0]) if vectors else 0
+        write_index(path, [(ids, vectors, texts, metadatas)], len(texts), dim, dtype, ivf_lists)
+        return cls(path, embedding)
+
+
+if __name__ == "__main__":
+    import argparse
+    from langchain_chroma import Chroma
+    from config.settings import PERSIST_DIR
+    from vectorstore.retriever import get_vectorstore_version
+
+    parser = argparse.ArgumentParser(description="Export the Chroma collection to a memory-mapped index")
+    parser.add_argument("--path", default=MMAP_INDEX_DIR)
+    parser.add_argument("--dtype", choices=["float16", "int8"], default=MMAP_INDEX_DTYPE)
+    parser.add_argument("--ivf-lists", type=int, default=MMAP_IVF_LISTS, help="0 for exact search")
+    args = parser.parse_args()
+    export_from_chroma(Chroma(persist_directory=PERSIST_DIR)._collection, args.path, args.dtype,
+                       args.ivf_lists, version=get_vectorstore_version())
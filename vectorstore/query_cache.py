@@ -0,0 +1,103 @@
+"""Caches in front of dense retrieval.
+
+The query-embedding cache maps whitespace-normalized query text to its embedding,
+so a repeated query never reaches the embedding model. The result cache maps
+(query embedding, k) to the ids and relevance scores similarity search returned; it is
+cleared whenever the vectorstore version stamp changes, since a rebuild may replace
+or remove those documents. Both are LRUs bounded by entry count.
+"""
+import hashlib
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(text: str) -> str:
+    # Case is kept: identifiers in code queries are case-sensitive
+    return re.sub(r"\s+", " ", text.strip())
+
+
+def result_key(vector, k) -> bytes:
+    """Key for the result cache: a digest of the float32 query embedding plus k"""
+    return hashlib.blake2b(vector.tobytes(), digest_size=16).digest() + k.to_bytes(4, "little")
+
+
+class LRUCache:
+    """Thread-safe LRU with hit counters and an approximate memory footprint.
+
+    ``sizeof(key, value)`` estimates the bytes one entry holds.
+    """
+
+    def __init__(self, max_entries, sizeof):
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.memory_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= self.sizeof(key, old)
+            self._entries[key] = value
+            self.memory_bytes += self.sizeof(key, value)
+            while len(self._entries) > self.max_entries:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.memory_bytes -= self.sizeof(evicted_key, evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_bytes': self.memory_bytes,
+            }
+
+
+class EmbeddingCache(LRUCache):
+    """Normalized query text -> float32 embedding"""
+
+    def __init__(self, max_entries):
+        super().__init__(max_entries, lambda key, vector: sys.getsizeof(key) + vector.nbytes)
+
+
+class ResultCache(LRUCache):
+    """result_key(embedding, k) -> [(document id, score)], valid for one vectorstore version"""
+
+    def __init__(self, max_entries, version):
+        super().__init__(max_entries, lambda key, hits: len(key) + sum(sys.getsizeof(i) + 8 for i, _ in hits))
+        self.version = version
+        self._version = version()
+
+    def get(self, key):
+        version = self.version()
+        if version != self._version:
+            self._version = version
+            self.clear()
+        return super().get(key)
@@ -0,0 +1,90 @@
+"""Cross-encoder reranking of retrieval candidates.
+
+A cross-encoder reads the query and a candidate together, which ranks code snippets
+much better than comparing two independently computed embeddings, at the cost of a
+forward pass per candidate. Candidates are scored in batches on the CPU, and the
+stage is skipped when the best dense hit already leads the runner-up by
+RERANK_SKIP_MARGIN, since reranking rarely changes the top result then.
+"""
+import threading
+import time
+from utils import metrics
+from config.settings import (
+    RERANK_MODEL_NAME,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_SKIP_MARGIN
+)
+
+
+class Reranker:
+    def __init__(self, model_name=RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE,
+                 max_length=RERANK_MAX_LENGTH, skip_margin=RERANK_SKIP_MARGIN):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.skip_margin = skip_margin
+        self.reranked = 0
+        self.skipped = 0
+        self.seconds = 0.0
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    print(f"Initializing reranker: {self.model_name}")
+                    self._model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+        return self._model
+
+    def score(self, query, texts):
+        """Relevance of each text to the query, higher is better"""
+        pairs = [(query, text) for text in texts]
+        return self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False).tolist()
+
+    def should_rerank(self, dense_scores):
+        """False when the top dense hit leads the runner-up by skip_margin or more"""
+        return len(dense_scores) > 1 and dense_scores[0] - dense_scores[1] < self.skip_margin
+
+    def rerank(self, query, candidates, k, dense_scores=None):
+        """Best k candidates; with ``dense_scores`` the dense order is kept when it is decisive"""
+        if dense_scores is not None and not self.should_rerank(dense_scores):
+            with self._lock:
+                self.skipped += 1
+            metrics.annotate(reranked=False)
+            return candidates[:k]
+        start = time.perf_counter()
+        with metrics.stage("rerank", candidates=len(candidates)):
+            scores = self.score(query, [doc.page_content for doc in candidates])
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        with self._lock:
+            self.reranked += 1
+            self.seconds += time.perf_counter() - start
+        return [candidates[i] for i in order[:k]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.reranked + self.skipped
+            return {
+                'reranked': self.reranked,
+                'skipped': self.skipped,
+                'rerank_rate': self.reranked / total if total else 0.0,
+                'avg_rerank_ms': 1000 * self.seconds / self.reranked if self.reranked else 0.0,
+            }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Get the singleton reranker; the model loads on the first rerank"""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+                metrics.add_gauges("reranker", _reranker.stats)
+    return _reranker
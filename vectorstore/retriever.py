@@ -10,38 +10,317 @@
 
 # def get_retriever():
 #     return get_vectorstore().as_retriever(search_type="similarity", search_kwargs={"k": 5})
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from config.settings import EMBEDDING_MODEL_NAME, PERSIST_DIR
+import os
+import re
+import threading
+import time
+from typing import List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from utils import metrics
+from config.settings import (
+    EMBEDDING_MODEL_NAME,
+    PERSIST_DIR,
+    VECTORSTORE_VERSION_FILE,
+    RETRIEVER_MODE,
+    BATCHING_ENABLED,
+    VECTOR_BACKEND,
+    MMAP_INDEX_DIR,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    RETRIEVAL_CACHE_SIZE,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    HYBRID_CANDIDATES,
+    HYBRID_RRF_K,
+    LEXICAL_DECISIVE_RATIO
+)
 
-# Create a singleton embedding model to ensure consistency
+class InstrumentedEmbeddings(Embeddings):
+    """Times every embedding call as an "embedding" stage of the current trace"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with metrics.stage("embedding", texts=len(texts)):
+            return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with metrics.stage("embedding", texts=1):
+            return self.model.embed_query(text)
+
+class BatchedEmbeddings(Embeddings):
+    """Merges concurrent embed_query calls into one embed_documents call.
+
+    Document embedding (indexing) already comes in batches and is passed through.
+    """
+
+    def __init__(self, model):
+        from utils.batching import MicroBatcher
+        self.model = model
+        self.batcher = MicroBatcher(model.embed_documents, name="embedding-batcher")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.submit(text)
+
+class CachedEmbeddings(Embeddings):
+    """Serves repeated embed_query calls from an LRU; a hit records no embedding stage"""
+
+    def __init__(self, model, max_entries=QUERY_EMBEDDING_CACHE_SIZE):
+        from vectorstore.query_cache import EmbeddingCache
+        self.model = model
+        self.cache = EmbeddingCache(max_entries)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        import numpy as np
+        from vectorstore.query_cache import normalize_query
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = np.asarray(self.model.embed_query(key), dtype=np.float32)
+            self.cache.put(key, vector)
+        return vector.tolist()
+
+def wrap_embeddings(model):
+    """Add query micro-batching (if enabled), timing and the query cache around an embedding model"""
+    if BATCHING_ENABLED:
+        model = BatchedEmbeddings(model)
+    model = InstrumentedEmbeddings(model)
+    if QUERY_EMBEDDING_CACHE_SIZE:
+        model = CachedEmbeddings(model)
+    return model
+
+# Create a singleton embedding model to ensure consistency.
+# torch/transformers and chromadb are imported on first use, not at import time.
 _embedding_model = None
+_embedding_lock = threading.Lock()
 
 def get_embedding_model():
     """Get a singleton embedding model instance"""
     global _embedding_model
     if _embedding_model is None:
-        print(f"Initializing embedding model: {EMBEDDING_MODEL_NAME}")
-        _embedding_model = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
-            #model_kwargs={'device': 'gpu'},  # Explicitly set device
-            encode_kwargs={'normalize_embeddings': True}  # Ensure consistent normalization
-        )
+        with _embedding_lock:
+            if _embedding_model is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                print(f"Initializing embedding model: {EMBEDDING_MODEL_NAME}")
+                _embedding_model = wrap_embeddings(HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    #model_kwargs={'device': 'gpu'},  # Explicitly set device
+                    encode_kwargs={'normalize_embeddings': True}  # Ensure consistent normalization
+                ))
     return _embedding_model
 
+_vectorstore = None
+_vectorstore_lock = threading.Lock()
+
+def _mmap_outdated(store):
+    """A newer export than the loaded snapshot is on disk (checked while the snapshot is stale)"""
+    from vectorstore.mmap_index import MmapVectorStore
+    loaded = store.info.get("version")
+    return loaded != get_vectorstore_version() and MmapVectorStore.exported_version(MMAP_INDEX_DIR) != loaded
+
 def get_vectorstore():
-    """Get the Chroma vectorstore"""
-    embedding_model = get_embedding_model()
-    vectorstore = Chroma(
-        persist_directory=PERSIST_DIR, 
-        embedding_function=embedding_model
-    )
-    return vectorstore
+    """Get a singleton vectorstore for search: Chroma, or the mmap index (VECTOR_BACKEND).
+
+    The mmap index is reopened once a rebuild has exported a new snapshot.
+    """
+    global _vectorstore
+    if _vectorstore is not None and VECTOR_BACKEND == "mmap" and _mmap_outdated(_vectorstore):
+        with _vectorstore_lock:
+            if _mmap_outdated(_vectorstore):
+                from vectorstore.mmap_index import MmapVectorStore
+                print(f"Reopening the mmap index at {MMAP_INDEX_DIR} for the new vectorstore version")
+                _vectorstore = MmapVectorStore.load(
+                    MMAP_INDEX_DIR,
+                    _vectorstore.embedding,
+                    expected_version=get_vectorstore_version()
+                )
+    if _vectorstore is None:
+        embedding_model = get_embedding_model()
+        with _vectorstore_lock:
+            if _vectorstore is None and VECTOR_BACKEND == "mmap":
+                from vectorstore.mmap_index import MmapVectorStore
+                _vectorstore = MmapVectorStore.load(
+                    MMAP_INDEX_DIR,
+                    embedding_model,
+                    expected_version=get_vectorstore_version()
+                )
+            elif _vectorstore is None:
+                from langchain_chroma import Chroma
+                _vectorstore = Chroma(
+                    persist_directory=PERSIST_DIR, 
+                    embedding_function=embedding_model
+                )
+    return _vectorstore
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Get the singleton (query embedding, k) -> (document id, score) cache, or None when disabled"""
+    global _result_cache
+    if _result_cache is None and RETRIEVAL_CACHE_SIZE:
+        with _result_cache_lock:
+            if _result_cache is None:
+                from vectorstore.query_cache import ResultCache
+                _result_cache = ResultCache(RETRIEVAL_CACHE_SIZE, version=get_vectorstore_version)
+    return _result_cache
+
+def _search_by_vector(vectorstore, vector, k):
+    """similarity_search_with_relevance_scores for a query that is already embedded"""
+    relevance = vectorstore._select_relevance_score_fn()
+    return [(doc, relevance(score))
+            for doc, score in vectorstore.similarity_search_by_vector_with_relevance_scores(vector, k=k)]
+
+def dense_search_with_scores(query: str, k: int):
+    """(document, relevance score) pairs, best first, through the query-embedding and result caches"""
+    import numpy as np
+    from vectorstore.query_cache import result_key
+    vectorstore = get_vectorstore()
+    cache = get_result_cache()
+    if cache is None:
+        return vectorstore.similarity_search_with_relevance_scores(query, k=k)
+    # Embedded once: the vector is both the result-cache key and the search query
+    vector = get_embedding_model().embed_query(query)
+    key = result_key(np.asarray(vector, dtype=np.float32), k)
+    hits = cache.get(key)
+    if hits is not None:
+        found = {doc.id: doc for doc in vectorstore.get_by_ids([doc_id for doc_id, _ in hits])}
+        # Rebuilt without a version bump: fall through to a real search
+        if len(found) == len(hits):
+            metrics.annotate(result_cache="hit")
+            return [(found[doc_id], score) for doc_id, score in hits]
+    results = _search_by_vector(vectorstore, vector, k)
+    if all(doc.id for doc, _ in results):
+        cache.put(key, [(doc.id, score) for doc, score in results])
+    return results
+
+def dense_search(query: str, k: int) -> List[Document]:
+    return [doc for doc, _ in dense_search_with_scores(query, k)]
+
+def cache_stats() -> dict:
+    """Hit rates and memory footprint of the retriever caches"""
+    stats = {}
+    if isinstance(_embedding_model, CachedEmbeddings):
+        stats["query_embedding"] = _embedding_model.cache.stats()
+    if _result_cache is not None:
+        stats["retrieval"] = _result_cache.stats()
+    return stats
+
+metrics.add_gauges("retriever_cache", lambda: {
+    f"{cache}_{name}": value for cache, values in cache_stats().items() for name, value in values.items()
+})
+
+class DenseRetriever(BaseRetriever):
+    """Plain similarity search, going through the retriever caches (and the reranker if enabled)"""
+    k: int = 5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if not RERANK_ENABLED:
+            return dense_search(query, self.k)
+        from vectorstore.reranker import get_reranker
+        results = dense_search_with_scores(query, max(self.k, RERANK_CANDIDATES))
+        return get_reranker().rerank(
+            query, [doc for doc, _ in results], self.k, dense_scores=[score for _, score in results]
+        )
 
 def get_retriever(k=5):
     """Get the retriever with specified number of results"""
-    vectorstore = get_vectorstore()
-    return vectorstore.as_retriever(
-        search_type="similarity", 
-        search_kwargs={"k": k}
-    )
\ No newline at end of file
+    if RETRIEVER_MODE == "hybrid":
+        return HybridRetriever(k=k)
+    return DenseRetriever(k=k)
+
+# snake_case, camelCase or call-like tokens: the queries BM25 can answer on its own
+IDENTIFIER_QUERY = re.compile(r"\b[A-Za-z]+_\w+|\b[a-z]+[A-Z]\w*|\w+\(")
+
+hybrid_stats = {"lexical_only": 0, "fused": 0}
+
+class HybridRetriever(BaseRetriever):
+    """BM25 over code tokens fused with dense similarity via reciprocal rank fusion.
+
+    When the query names identifiers and BM25 finds the chunk defining one of them
+    (or its best hit clearly outscores the rest), the lexical results are returned
+    directly and the embedding model is never touched. The vectorstore is only
+    opened when dense search is needed.
+    """
+    k: int = 5
+    candidates: int = HYBRID_CANDIDATES
+    rrf_k: int = HYBRID_RRF_K
+    decisive_ratio: float = LEXICAL_DECISIVE_RATIO
+
+    def _lexical_only(self, query, hits, index):
+        """Return the BM25 results when they settle the query on their own, else None"""
+        identifiers = {m.group(0).rstrip("(").lower() for m in IDENTIFIER_QUERY.finditer(query)}
+        if not hits or not identifiers:
+            return None
+        # A chunk that defines a queried identifier is as good as it gets
+        defining = [
+            doc_id for doc_id, _ in hits
+            if str(index.docs[doc_id][1].get("name", "")).split(".")[-1].lower() in identifiers
+        ]
+        if defining or len(hits) == 1 or hits[0][1] >= self.decisive_ratio * hits[1][1]:
+            ordered = defining + [doc_id for doc_id, _ in hits if doc_id not in defining]
+            return [index.document(doc_id) for doc_id in ordered[:self.k]]
+        return None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        from vectorstore.lexical import get_bm25_index
+        index = get_bm25_index()
+        hits = index.search(query, k=self.candidates)
+        lexical = self._lexical_only(query, hits, index)
+        if lexical is not None:
+            hybrid_stats["lexical_only"] += 1
+            return lexical
+
+        hybrid_stats["fused"] += 1
+        dense_results = dense_search_with_scores(query, self.candidates)
+        dense = [doc for doc, _ in dense_results]
+        scores, documents = {}, {}
+        for rank, (doc_id, _) in enumerate(hits):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            documents.setdefault(doc_id, None)
+        for rank, doc in enumerate(dense):
+            doc_id = doc.id or doc.page_content
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            documents[doc_id] = doc
+        depth = max(self.k, RERANK_CANDIDATES) if RERANK_ENABLED else self.k
+        ranked = sorted(scores, key=scores.get, reverse=True)[:depth]
+        fused = [documents[doc_id] or index.document(doc_id) for doc_id in ranked]
+        if not RERANK_ENABLED:
+            return fused
+        from vectorstore.reranker import get_reranker
+        # The skip check must look at the order it would return: the fused one. Its top two
+        # are compared by dense score; one that dense search did not find always reranks.
+        dense_by_id = {doc.id or doc.page_content: score for doc, score in dense_results}
+        fused_scores = [dense_by_id.get(doc_id) for doc_id in ranked[:2]]
+        if None in fused_scores:
+            fused_scores = None
+        return get_reranker().rerank(query, fused, self.k, dense_scores=fused_scores)
+
+def get_vectorstore_version():
+    """Get the stamp of the current vectorstore build ("0" if it was never stamped)"""
+    try:
+        with open(VECTORSTORE_VERSION_FILE) as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+def bump_vectorstore_version():
+    """Record a new vectorstore build so caches keyed on the old one are dropped"""
+    version = str(time.time_ns())
+    os.makedirs(os.path.dirname(VECTORSTORE_VERSION_FILE), exist_ok=True)
+    with open(VECTORSTORE_VERSION_FILE, "w") as f:
+        f.write(version)
+    return version